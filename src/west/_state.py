@@ -0,0 +1,41 @@
+# Copyright (c) 2020, Nordic Semiconductor ASA
+#
+# SPDX-License-Identifier: Apache-2.0
+
+'''Helpers for the JSON files west keeps in a workspace's .west directory.
+
+These files only cache things west can find out again, so they are
+read and written on a best-effort basis.
+
+Nothing in here is public API.
+'''
+
+import json
+import os
+
+from west import log
+
+def read_state(topdir, name):
+    # Read the JSON file topdir/.west/<name>, returning its contents as
+    # a dict. Missing or corrupted files are treated as empty.
+
+    try:
+        with open(os.path.join(topdir, '.west', name), 'r') as f:
+            ret = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return ret if isinstance(ret, dict) else {}
+
+def write_state(topdir, name, state):
+    # Replace the JSON file topdir/.west/<name> with the dict 'state'.
+    # The file is written under a temporary name first, so readers
+    # never see a partial file. Errors are not fatal.
+
+    path = os.path.join(topdir, '.west', name)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(tmp, path)
+    except OSError as e:
+        log.dbg(f'unable to write {path}: {e}')
@@ -0,0 +1,137 @@
+# Copyright (c) 2020, Nordic Semiconductor ASA
+#
+# SPDX-License-Identifier: Apache-2.0
+
+'''West batch command.
+
+Nothing in here is public API.
+'''
+
+import argparse
+import os
+import shlex
+import sys
+import textwrap
+
+from west import log
+from west import configuration as config
+from west.commands import WestCommand, CommandError
+from west.util import quote_sh_list
+from west.app.inprocess import exit_code, stat_files
+
+# Commands which make no sense inside a batch.
+_NOT_IN_BATCH = ('batch', 'daemon')
+
+class Batch(WestCommand):
+
+    def __init__(self):
+        super().__init__(
+            'batch',
+            'run many west commands in one process',
+            textwrap.dedent('''\
+            Runs the west commands in a file, one per line, or read
+            from standard input if FILE is "-" or not given.
+
+            Each line is a west command line, like "west list" or
+            just "list". Lines are split into arguments as a POSIX
+            shell would, without expanding anything. Blank lines
+            and comments starting with "#" are ignored.
+
+            The commands all run in this process, so the workspace's
+            configuration, manifest, and extension commands are only
+            loaded once, instead of once per command. They are
+            loaded again between commands if a command changes the
+            files they come from, e.g. "west config" or "west update".
+
+            A command which fails doesn't stop the batch. When all
+            commands have run, the exit code of each one is printed
+            to stderr, and this command fails if any of them did.
+
+            Top level options like --trace-git and --profile only
+            take effect when given before "batch", not on a line.'''))
+
+        # Back-pointer to the WestApp, set there. The batch needs it
+        # to run commands and to reload the workspace.
+        self.app = None
+
+    def do_add_parser(self, parser_adder):
+        parser = parser_adder.add_parser(
+            self.name, help=self.help, description=self.description,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+        parser.add_argument('file', nargs='?', default='-',
+                            help='''file with one command per line,
+                            or "-" for standard input (the default)''')
+        return parser
+
+    def do_run(self, args, user_args):
+        assert self.app, "Batch has no WestApp and can't do its job"
+
+        if args.file == '-':
+            results = self._run_lines(sys.stdin)
+        else:
+            try:
+                f = open(args.file, encoding='utf-8')
+            except OSError as e:
+                log.die(f"can't read {args.file}: {e}")
+            with f:
+                results = self._run_lines(f)
+
+        failed = [result for result in results if result[2]]
+        print(f'west batch: {len(results)} commands, {len(failed)} failed',
+              file=sys.stderr)
+        for lineno, argv, returncode in results:
+            print(f'  line {lineno}: exit code {returncode}: '
+                  f'west {quote_sh_list(argv)}', file=sys.stderr)
+        sys.stderr.flush()
+
+        if failed:
+            raise CommandError()
+
+    def _run_lines(self, lines):
+        # Run the command on each line, and return a list of
+        # (line number, argv, exit code) tuples, one per command.
+
+        ret = []
+        generation = config._write_generation
+        stats = stat_files(self.app.workspace_files())
+        for lineno, line in enumerate(lines, start=1):
+            try:
+                argv = shlex.split(line, comments=True)
+            except ValueError as e:
+                log.err(f'line {lineno}: {e}')
+                ret.append((lineno, [line.strip()], 1))
+                continue
+            if not argv:
+                continue
+            if argv[0] == 'west':
+                argv = argv[1:]
+
+            if (generation != config._write_generation or
+                    stats != stat_files(stats)):
+                self.app.reload()
+                generation = config._write_generation
+                stats = stat_files(self.app.workspace_files())
+
+            ret.append((lineno, argv, self._run_one(lineno, argv)))
+        return ret
+
+    def _run_one(self, lineno, argv):
+        # Run one command, and return its exit code.
+
+        cwd = os.getcwd()
+        try:
+            command = self.app.west_parser.parse_known_args(argv)[0].command
+            if command in _NOT_IN_BATCH:
+                log.err(f'line {lineno}: "west {command}" '
+                        "can't run in a batch")
+                return 1
+            self.app.run_command(argv)
+        except SystemExit as e:
+            return exit_code(e)
+        finally:
+            # Make sure one command can't change the working directory
+            # of the next. Its output should all be out, too.
+            os.chdir(cwd)
+            sys.stdout.flush()
+            sys.stderr.flush()
+        return 0
@@ -98,7 +98,8 @@ class Config(WestCommand):
             'config',
             'get or set configuration settings in west config files',
             CONFIG_DESCRIPTION,
-            requires_workspace=False)
+            requires_workspace=False,
+            requires_manifest=False)
 
     def do_add_parser(self, parser_adder):
         parser = parser_adder.add_parser(
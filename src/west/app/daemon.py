@@ -0,0 +1,263 @@
+# Copyright (c) 2020, Nordic Semiconductor ASA
+#
+# SPDX-License-Identifier: Apache-2.0
+
+'''West daemon command, and the client side of its protocol.
+
+Nothing in here is public API.
+'''
+
+import argparse
+import contextlib
+from io import StringIO
+import json
+import os
+import signal
+import socket
+import sys
+import textwrap
+import traceback
+
+from west import log
+from west.commands import WestCommand
+from west.util import quote_sh_list
+from west.app.inprocess import exit_code, stat_files
+
+# Commands the daemon runs for clients. They only read the
+# configuration and manifest, and print to sys.stdout and sys.stderr,
+# so their output can be captured and sent back. Commands which run
+# subprocesses that write to the terminal, like 'west status', can't
+# be served this way.
+DAEMON_COMMANDS = ('list', 'manifest', 'topdir')
+
+# Top level options the client may pass to the daemon. Others, like
+# --trace-file or --profile, have to take effect in the client's own
+# process, so commands using them are never sent to the daemon.
+_DAEMON_OPTIONS = ('-v', '-vv', '-vvv', '--verbose')
+
+# Environment variables which affect which files a command reads. If a
+# client's values differ from the daemon's, it runs the command itself.
+_DAEMON_ENV = ('WEST_CONFIG_SYSTEM', 'WEST_CONFIG_GLOBAL',
+               'WEST_CONFIG_LOCAL', 'XDG_CONFIG_HOME', 'HOME', 'ZEPHYR_BASE')
+
+# How long a client waits for the daemon to answer before giving up
+# and running the command itself, in seconds.
+_DAEMON_TIMEOUT = 30
+
+class Daemon(WestCommand):
+
+    def __init__(self):
+        super().__init__(
+            'daemon',
+            'run read-only commands from a long-running process',
+            textwrap.dedent(f'''\
+            Keeps the workspace's configuration and parsed manifest
+            in memory, and runs these commands for other west
+            processes in the same workspace, which then don't have
+            to load anything themselves:
+
+            {", ".join(DAEMON_COMMANDS)}
+
+            This is useful when something, like an IDE or a shell
+            prompt, runs these commands all the time.
+
+            The daemon listens on the socket .west/daemon.sock until
+            it's stopped with "west daemon --stop", interrupted, or
+            terminated. Before each command, it checks if the
+            configuration files or the files the manifest was read
+            from have changed, and loads them again if so.
+
+            Commands still run without the daemon if any top level
+            option besides -v is given, if the environment variables
+            which locate configuration files differ from the daemon's,
+            or if the WEST_NO_DAEMON environment variable is set.
+
+            This requires Unix domain socket support.'''))
+
+        # Back-pointer to the WestApp, set there. The daemon needs it
+        # to run commands and to reload the workspace.
+        self.app = None
+
+    def do_add_parser(self, parser_adder):
+        parser = parser_adder.add_parser(
+            self.name, help=self.help, description=self.description,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+        parser.add_argument('--stop', action='store_true',
+                            help='stop the running daemon')
+        return parser
+
+    def do_run(self, args, user_args):
+        assert self.app, "Daemon has no WestApp and can't do its job"
+
+        if not hasattr(socket, 'AF_UNIX'):
+            log.die('west daemon needs Unix domain sockets, '
+                    'which are not supported here')
+
+        path = _socket_path(self.topdir)
+        if args.stop:
+            try:
+                _request(path, {'stop': True})
+            except OSError:
+                log.die(f'no daemon is running for {self.topdir}')
+            return
+
+        if os.path.exists(path):
+            try:
+                _request(path, {'ping': True})
+            except ConnectionRefusedError:
+                # Left behind by a daemon which didn't exit cleanly.
+                os.unlink(path)
+            else:
+                log.die(f'a daemon is already running for {self.topdir}')
+
+        self._serve(path)
+
+    def _serve(self, path):
+        # Accept and handle connections until we're told to stop.
+
+        # Make sure the finally block below runs on SIGTERM.
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            try:
+                server.bind(path)
+            except OSError as e:
+                log.die(f"can't listen on {path}: {e}")
+            server.listen()
+            _log(f'serving {self.topdir}')
+
+            stats = stat_files(self.app.workspace_files())
+            while True:
+                conn, _ = server.accept()
+                with conn:
+                    request = _recv(conn)
+                    if request is None:
+                        continue
+                    if request.get('stop'):
+                        _send(conn, {})
+                        break
+                    if request.get('ping'):
+                        _send(conn, {})
+                        continue
+
+                    if self.app.mle or stats != stat_files(stats):
+                        _log('reloading the workspace')
+                        self.app.reload()
+                        stats = stat_files(self.app.workspace_files())
+
+                    _send(conn, self._handle(request))
+        finally:
+            server.close()
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+        _log('stopped')
+
+    def _handle(self, request):
+        # Run the command in a request, and return the response.
+
+        argv, cwd, env = request['argv'], request['cwd'], request['env']
+        if (self.app.mle or not can_serve(argv) or
+                env != {var: os.environ.get(var) for var in _DAEMON_ENV}):
+            return {'fallback': True}
+
+        stdout, stderr = StringIO(), StringIO()
+        returncode = 0
+        old_cwd = os.getcwd()
+        try:
+            os.chdir(cwd)
+            with contextlib.redirect_stdout(stdout), \
+                    contextlib.redirect_stderr(stderr):
+                try:
+                    self.app.run_command(argv)
+                except SystemExit as e:
+                    returncode = exit_code(e)
+                except Exception:
+                    traceback.print_exc()
+                    returncode = 1
+        except OSError:
+            # The client's working directory is gone.
+            return {'fallback': True}
+        finally:
+            os.chdir(old_cwd)
+
+        _log(f'{cwd}: west {quote_sh_list(argv)}: exit code {returncode}')
+        return {'returncode': returncode, 'stdout': stdout.getvalue(),
+                'stderr': stderr.getvalue()}
+
+def can_serve(argv):
+    # True if the command in argv is one the daemon runs, and no top
+    # level options it can't handle are given.
+
+    for arg in argv:
+        if arg in DAEMON_COMMANDS:
+            return True
+        elif arg not in _DAEMON_OPTIONS:
+            return False
+    return False
+
+def run_in_daemon(topdir, argv):
+    # If a daemon is serving topdir and can run the command in argv,
+    # have it do that, print the output, and return the exit code.
+    #
+    # Returns None if the caller should run the command itself.
+
+    if ('WEST_NO_DAEMON' in os.environ or
+            not hasattr(socket, 'AF_UNIX') or not can_serve(argv)):
+        return None
+
+    path = _socket_path(topdir)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        response = _request(path, {
+            'argv': list(argv),
+            'cwd': os.getcwd(),
+            'env': {var: os.environ.get(var) for var in _DAEMON_ENV}})
+    except (OSError, ValueError):
+        # The daemon isn't running after all, or something went wrong
+        # while talking to it. Either way, the command can still run.
+        return None
+    if response is None or 'returncode' not in response:
+        return None
+
+    sys.stdout.write(response['stdout'])
+    sys.stdout.flush()
+    sys.stderr.write(response['stderr'])
+    sys.stderr.flush()
+    return response['returncode']
+
+def _log(msg):
+    # Say what the daemon is doing. Its output is often a pipe or a
+    # file, so flush each message right away.
+
+    log.inf('west daemon:', msg)
+    sys.stdout.flush()
+
+def _socket_path(topdir):
+    # WestApp._run() also looks for this file, so it doesn't have to
+    # import this module if it's not there.
+    return os.path.join(topdir, '.west', 'daemon.sock')
+
+def _request(path, request):
+    # Send a request to the daemon listening at path, and return its
+    # response, or None if it hung up without answering.
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(_DAEMON_TIMEOUT)
+        sock.connect(path)
+        _send(sock, request)
+        return _recv(sock)
+
+# The protocol: each connection carries one request from the client,
+# and one response from the daemon. Each is a JSON object on a line
+# by itself.
+
+def _send(sock, obj):
+    sock.sendall(json.dumps(obj).encode('utf-8') + b'\n')
+
+def _recv(sock):
+    with sock.makefile('rb') as f:
+        line = f.readline()
+    return json.loads(line) if line else None
@@ -0,0 +1,39 @@
+# Copyright (c) 2020, Nordic Semiconductor ASA
+#
+# SPDX-License-Identifier: Apache-2.0
+
+'''Helpers for running many west commands in one process.
+
+These are shared by "west daemon" and "west batch", and are kept
+apart from both so neither has to import the other.
+
+Nothing in here is public API.
+'''
+
+import os
+import sys
+
+def stat_files(paths):
+    # Map each path to a tuple that changes when the file does, or to
+    # None if it doesn't exist.
+
+    ret = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            ret[path] = None
+        else:
+            ret[path] = (st.st_mtime_ns, st.st_size, st.st_ino)
+    return ret
+
+def exit_code(e):
+    # Convert a SystemExit to the exit code of a process which raised
+    # it, as the interpreter does.
+
+    if e.code is None:
+        return 0
+    elif isinstance(e.code, int):
+        return e.code
+    print(e.code, file=sys.stderr)
+    return 1
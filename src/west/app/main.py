@@ -12,8 +12,11 @@ Nothing in here is public API.
 '''
 
 import argparse
+import atexit
 from collections import OrderedDict
+from collections.abc import Mapping
 import colorama
+import importlib
 from io import StringIO
 import logging
 import os
@@ -26,13 +29,12 @@ import textwrap
 import traceback
 
 from west import log
+from west import trace
 from west import configuration as config
 from west.commands import WestCommand, extension_commands, \
     CommandError, ExtensionCommandError
-from west.app.project import List, ManifestCommand, Diff, Status, \
-    SelfUpdate, ForAll, Init, Update, Topdir
-from west.app.config import Config
-from west.manifest import Manifest, MalformedConfig, MalformedManifest, \
+from west.app.workspace import Workspace
+from west.manifest import MalformedConfig, MalformedManifest, \
     ManifestVersionError, ManifestImportFailed, _ManifestImportDepth, \
     ManifestProject, MANIFEST_REV_BRANCH
 from west.util import quote_sh_list, west_topdir, WestNotFound
@@ -51,35 +53,37 @@ class WestApp:
 
     def __init__(self):
         self.topdir = None          # west_topdir()
+        self.workspace = None       # west.app.workspace.Workspace
         self.manifest = None        # west.manifest.Manifest
         self.mle = None             # saved exception if load_manifest() fails
-        self.builtins = {}          # command name -> WestCommand instance
+        self.builtins = _Builtins(self)  # command name -> WestCommand
         self.extensions = {}        # extension command name -> spec
-        self.builtin_groups = OrderedDict()    # group name -> WestCommand list
+        self.builtin_groups = OrderedDict()    # group name -> command names
         self.extension_groups = OrderedDict()  # project path -> ext spec list
         self.west_parser = None     # a WestArgumentParser
         self.subparser_gen = None   # an add_subparsers() return value
 
-        for group, classes in BUILTIN_COMMAND_GROUPS.items():
-            lst = [cls() for cls in classes]
-            self.builtins.update({command.name: command for command in lst})
-            self.builtin_groups[group] = lst
-
-        # Give the help instance a back-pointer up here.
-        #
-        # A dirty layering violation, but it does need this data:
-        #
-        # - 'west help <command>' needs to call into <command>'s
-        #   parser's print_help()
-        # - 'west help' needs self.west_parser, which
-        #   the argparse API does not give us a future-proof way
-        #   to access from the Help object's parser attribute,
-        #   which comes from subparser_gen.
-        self.builtins['help'].app = self
+        for group, commands in BUILTIN_COMMAND_GROUPS.items():
+            self.builtin_groups[group] = [name for name, _, _ in commands]
 
     def run(self, argv):
         # Run the command-line application with argument list 'argv'.
 
+        # Start tracing right away if asked to, so the manifest
+        # loading below is included too.
+        argv, early = _early_options(argv)
+        if early.trace_git is not None:
+            trace.enable_git_trace()
+            atexit.register(trace.write_git_summary, early.trace_git)
+        if early.trace_file is not None:
+            trace.enable_span_trace()
+            atexit.register(trace.write_trace_file, early.trace_file)
+
+        with trace.profile(early.profile, memory=early.profile_memory):
+            with trace.span('west', argv=argv):
+                self._run(argv)
+
+    def _run(self, argv):
         # See if we're in a workspace. It's fine if we're not.
         # Note that this falls back on searching from ZEPHYR_BASE
         # if the current directory isn't inside a west workspace.
@@ -88,15 +92,31 @@ class WestApp:
         except WestNotFound:
             pass
 
+        # If a 'west daemon' is serving this workspace, it can run
+        # some commands without loading anything. Don't import the
+        # client unless the daemon's socket is there.
+        if self.topdir and os.path.exists(os.path.join(self.topdir, '.west',
+                                                       'daemon.sock')):
+            from west.app.daemon import run_in_daemon
+            returncode = run_in_daemon(self.topdir, argv)
+            if returncode is not None:
+                sys.exit(returncode)
+
         # Read the configuration files. We need this to get
         # manifest.path to parse the manifest, etc.
         #
         # TODO: re-work to avoid global state (#149).
         config.read_config(topdir=self.topdir)
+        if self.topdir:
+            self.workspace = Workspace(self.topdir)
 
-        # Set self.manifest and self.extensions.
-        self.load_manifest()
-        self.load_extension_specs()
+        # Set self.manifest and self.extensions, unless we're about to
+        # run a built-in command which doesn't need them. Loading the
+        # manifest is most of the startup time for commands like
+        # 'west topdir', which shell prompts may run all the time.
+        if self.manifest_needed(argv):
+            self.load_manifest()
+            self.load_extension_specs()
 
         # Set up initial argument parsers. This requires knowing
         # self.extensions, so it can't happen before now.
@@ -105,6 +125,51 @@ class WestApp:
         # OK, we are all set. Run the command.
         self.run_command(argv)
 
+    def manifest_needed(self, argv):
+        # Peek at the command line arguments before they're parsed to
+        # decide if the manifest needs to be loaded. When in doubt,
+        # it does: only a known built-in command which doesn't require
+        # the manifest, or 'west --version', can skip it.
+        #
+        # Extensions are defined in the manifest, so we need it to run
+        # them or to know what they are for 'west help'.
+
+        args = iter(argv)
+        for arg in args:
+            if arg in ('-V', '--version'):
+                return False
+            elif arg in ('-z', '--zephyr-base', '--trace-file'):
+                next(args, None)
+            elif arg == '--' or not arg.startswith('-'):
+                command = self.builtins.get(arg)
+                return command is None or command.requires_manifest
+        return True
+
+    def reload(self):
+        # Throw away the configuration, manifest, and extensions, and
+        # load them again. 'west daemon' and 'west batch' use this when
+        # the files they come from have changed.
+
+        config._reread_config(topdir=self.topdir)
+        self.workspace = Workspace(self.topdir)
+        self.manifest = self.mle = None
+        self.extensions = {}
+        self.extension_groups = OrderedDict()
+        self.load_manifest()
+        self.load_extension_specs()
+        self.setup_parsers()
+
+    def workspace_files(self):
+        # The files reload() would load things from. If none of them
+        # have changed, there is no need to call it.
+
+        ret = [config._location(cfg, topdir=self.topdir) for cfg in
+               (config.ConfigFile.SYSTEM, config.ConfigFile.GLOBAL,
+                config.ConfigFile.LOCAL)]
+        if self.manifest is not None:
+            ret.extend(self.manifest._files)
+        return ret
+
     def load_manifest(self):
         # Try to parse the manifest. We'll save it if that works, so
         # it doesn't have to be re-parsed.
@@ -113,7 +178,7 @@ class WestApp:
             return
 
         try:
-            self.manifest = Manifest.from_file(topdir=self.topdir)
+            self.manifest = self.workspace.manifest
         except (ManifestVersionError, MalformedManifest, MalformedConfig,
                 FileNotFoundError, ManifestImportFailed) as e:
             # Defer exception handling to WestCommand.run(), which uses
@@ -181,7 +246,7 @@ class WestApp:
             elif isinst(_ManifestImportDepth):
                 log.die('failed, likely due to manifest import loop')
             elif isinst(ManifestImportFailed):
-                if args.command == 'update':
+                if args.command in ('update', 'fetch'):
                     return      # that's fine
 
                 p, f = self.mle.project, self.mle.filename
@@ -246,9 +311,15 @@ class WestApp:
 
         west_parser, subparser_gen = self.make_parsers()
 
-        # Add sub-parsers for the built-in commands.
-        for command in self.builtins.values():
-            command.add_parser(subparser_gen)
+        # Add stub parsers for the built-in commands.
+        #
+        # Like the extension stubs below, these just reserve the names
+        # of each command. Building the real parsers is slow enough to
+        # matter when west is run many times in a row, and only the
+        # parser for the command which actually runs is needed. That
+        # one is built by command_parser().
+        for name in self.builtins:
+            subparser_gen.add_parser(name, add_help=False)
 
         # Add stub parsers for extensions.
         #
@@ -265,6 +336,20 @@ class WestApp:
         self.west_parser = west_parser
         self.subparser_gen = subparser_gen
 
+    def command_parser(self, command):
+        # Build the real argument parser for a WestCommand, saving it
+        # in command.parser, and return a top level parser which
+        # includes it.
+        #
+        # Our original top level parser and subparser generator have
+        # stubs registered for every command name, which prevents us
+        # from registering the real command subparser there. Just make
+        # new ones.
+
+        west_parser, subparser_gen = self.make_parsers()
+        command.add_parser(subparser_gen)
+        return west_parser
+
     def make_parsers(self):
         # Make a fresh instance of the top level argument parser
         # and subparser generator, and return them in that order.
@@ -296,6 +381,29 @@ class WestApp:
                             version=f'West version: v{__version__}',
                             help='print the program version and exit')
 
+        parser.add_argument('--trace-git', nargs='?', const='-',
+                            metavar='FILE',
+                            help='''on exit, print a summary of the git
+                            commands west ran to stderr, or write it
+                            to FILE (given as --trace-git=FILE)''')
+
+        parser.add_argument('--trace-file', metavar='FILE',
+                            help='''on exit, write a timeline of what west
+                            did to FILE, in Chrome trace event JSON
+                            format; load it in Perfetto or
+                            chrome://tracing to view it''')
+
+        parser.add_argument('--profile', nargs='?', const='-',
+                            metavar='FILE',
+                            help='''profile west, printing the functions
+                            which took the most time to stderr on exit,
+                            or saving the profile to FILE for the pstats
+                            module (given as --profile=FILE)''')
+
+        parser.add_argument('--profile-memory', action='store_true',
+                            help='''on exit, print peak memory use and
+                            the biggest memory allocations to stderr''')
+
         subparser_gen = parser.add_subparsers(metavar='<command>',
                                               dest='command')
 
@@ -321,6 +429,9 @@ class WestApp:
         if args.help or args.command is None:
             args.command_name = args.command
             args.command = 'help'
+            reparse = False
+        else:
+            reparse = True
 
         # Finally, run the command.
         try:
@@ -328,8 +439,17 @@ class WestApp:
                 if self.mle:
                     self.handle_builtin_manifest_load_err(args)
 
-                cmd = self.builtins.get(args.command, self.builtins['help'])
-                cmd.run(args, unknown, self.topdir, manifest=self.manifest)
+                cmd = self.builtins[args.command]
+
+                # We only parsed the command's arguments with its stub
+                # parser. Parse them again with the real one, unless
+                # we're running 'help' in place of 'west -h'.
+                west_parser = self.command_parser(cmd)
+                if reparse:
+                    args, unknown = west_parser.parse_known_args(argv)
+
+                cmd.run(args, unknown, self.topdir, manifest=self.manifest,
+                        workspace=self.workspace)
             else:
                 self.run_extension(args.command, argv)
         except KeyboardInterrupt:
@@ -372,14 +492,8 @@ class WestApp:
 
         command = self.extensions[name].factory()
 
-        # Our original top level parser and subparser generator have some
-        # garbage state that prevents us from registering the 'real'
-        # command subparser. Just make new ones.
-        west_parser, subparser_gen = self.make_parsers()
-        command.add_parser(subparser_gen)
-
-        # Parse arguments again.
-        args, unknown = west_parser.parse_known_args(argv)
+        # Parse arguments again, with the real parser.
+        args, unknown = self.command_parser(command).parse_known_args(argv)
 
         # HACK: try to set ZEPHYR_BASE.
         #
@@ -394,7 +508,8 @@ class WestApp:
         #   themselves (easy if above is OK, unnecessary if it isn't)
         set_zephyr_base(args, self.manifest, self.topdir)
 
-        command.run(args, unknown, self.topdir, manifest=self.manifest)
+        command.run(args, unknown, self.topdir, manifest=self.manifest,
+                    workspace=self.workspace)
 
 class Help(WestCommand):
     # west help <command> implementation.
@@ -421,10 +536,10 @@ class Help(WestCommand):
 
         if not name:
             app.west_parser.print_help(top_level=True)
-        elif name == 'help':
-            self.parser.print_help()
         elif name in app.builtins:
-            app.builtins[name].parser.print_help()
+            command = app.builtins[name]
+            app.command_parser(command)
+            command.parser.print_help()
         elif app.extensions is not None and name in app.extensions:
             # It's fine that we don't handle any errors here. The
             # exception handling block in app.run_command is in a
@@ -438,6 +553,53 @@ class Help(WestCommand):
                         'which may be causing this issue.\n'
                         '  Try running "west update" or fixing the manifest.')
 
+class _Builtins(Mapping):
+    # WestApp.builtins: a read-only mapping from each built-in command
+    # name to its WestCommand instance.
+    #
+    # Importing every command's module takes long enough to matter
+    # for commands like 'west topdir', which shell prompts may run all
+    # the time. So a command's module is imported, and the instance
+    # created, the first time it's looked up. Checking if a name is
+    # in here or iterating over the names doesn't import anything.
+
+    def __init__(self, app):
+        self._app = app
+        self._where = {name: (module, cls)
+                       for commands in BUILTIN_COMMAND_GROUPS.values()
+                       for name, module, cls in commands}
+        self._commands = {}
+
+    def __getitem__(self, name):
+        if name not in self._commands:
+            module, cls = self._where[name]
+            command = getattr(importlib.import_module(module), cls)()
+            if name in ('help', 'daemon', 'batch'):
+                # Give these instances a back-pointer to the app.
+                #
+                # A dirty layering violation, but they do need it:
+                #
+                # - 'west help <command>' needs to call into
+                #   <command>'s parser's print_help()
+                # - 'west help' needs self.west_parser, which
+                #   the argparse API does not give us a future-proof
+                #   way to access from the Help object's parser
+                #   attribute, which comes from subparser_gen.
+                # - 'west daemon' and 'west batch' run other commands
+                #   and reload the workspace.
+                command.app = self._app
+            self._commands[name] = command
+        return self._commands[name]
+
+    def __contains__(self, name):
+        return name in self._where
+
+    def __iter__(self):
+        return iter(self._where)
+
+    def __len__(self):
+        return len(self._where)
+
 class WestHelpAction(argparse.Action):
 
     def __call__(self, parser, namespace, values, option_string=None):
@@ -503,14 +665,15 @@ class WestArgumentParser(argparse.ArgumentParser):
                 self.format_west_optional(append, wo, width)
 
             append('')
-            for group, commands in self.west_app.builtin_groups.items():
+            for group, names in self.west_app.builtin_groups.items():
                 if group is None:
                     # Skip hidden commands.
                     continue
 
                 append(group + ':')
-                for command in commands:
-                    self.format_command(append, command, width)
+                for name in names:
+                    self.format_command(append, self.west_app.builtins[name],
+                                        width)
                 append('')
 
             if self.west_app.extensions is None:
@@ -753,6 +916,48 @@ def dump_traceback():
         traceback.print_exc(file=f)
     return name
 
+def _early_options(argv):
+    # Find the values of the top level options which have to take
+    # effect before argv is parsed, so they cover everything west
+    # does. Returns (argv, early), where 'early' is an
+    # argparse.Namespace with these attributes:
+    #
+    # - trace_git: '-' to print the --trace-git summary to stderr, a
+    #   file name, or None if the option wasn't given
+    # - trace_file: the --trace-file file name, or None
+    # - profile: like trace_git, for --profile
+    # - profile_memory: True if --profile-memory was given
+    #
+    # A --trace-git or --profile FILE can only be given as
+    # --option=FILE, so 'west --trace-git update' doesn't treat
+    # 'update' as a file name. The returned argv has a bare --option
+    # replaced by --option=- to keep argparse from doing that too.
+
+    argv = list(argv)
+    early = argparse.Namespace(trace_git=None, trace_file=None,
+                               profile=None, profile_memory=False)
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        name, eq, value = arg.partition('=')
+        if name in ('--trace-git', '--profile'):
+            if not eq:
+                argv[i] = f'{name}=-'
+            setattr(early, name[2:].replace('-', '_'), value or '-')
+        elif name == '--trace-file':
+            if not eq:
+                i += 1
+                value = argv[i] if i < len(argv) else None
+            early.trace_file = value or None
+        elif arg == '--profile-memory':
+            early.profile_memory = True
+        elif arg in ('-z', '--zephyr-base'):
+            i += 1
+        elif arg == '--' or not arg.startswith('-'):
+            break
+        i += 1
+    return argv, early
+
 def main(argv=None):
     # Silence validation errors from pykwalify, which are logged at
     # logging.ERROR level. We want to handle those ourselves as
@@ -770,25 +975,32 @@ def main(argv=None):
 # If you add a command here, make sure to think about how it should be
 # handled in case of ManifestVersionError or other reason the manifest
 # might fail to load (import error, configuration file error, etc.)
+#
+# Each command is given as (name, module, class name), so its module
+# is only imported if it's used. See _Builtins.
 BUILTIN_COMMAND_GROUPS = {
     'built-in commands for managing git repositories': [
-        Init,
-        Update,
-        List,
-        ManifestCommand,
-        Diff,
-        Status,
-        ForAll,
+        ('init', 'west.app.project', 'Init'),
+        ('update', 'west.app.project', 'Update'),
+        ('fetch', 'west.app.project', 'Fetch'),
+        ('bundle', 'west.app.project', 'Bundle'),
+        ('list', 'west.app.project', 'List'),
+        ('manifest', 'west.app.project', 'ManifestCommand'),
+        ('diff', 'west.app.project', 'Diff'),
+        ('status', 'west.app.project', 'Status'),
+        ('forall', 'west.app.project', 'ForAll'),
     ],
 
     'other built-in commands': [
-        Help,
-        Config,
-        Topdir,
+        ('help', __name__, 'Help'),
+        ('config', 'west.app.config', 'Config'),
+        ('topdir', 'west.app.topdir', 'Topdir'),
+        ('daemon', 'west.app.daemon', 'Daemon'),
+        ('batch', 'west.app.batch', 'Batch'),
     ],
 
     # None is for hidden commands we don't want to show to the user.
-    None: [SelfUpdate]
+    None: [('selfupdate', 'west.app.project', 'SelfUpdate')]
 }
 
 if __name__ == "__main__":
@@ -6,26 +6,33 @@
 '''West project commands'''
 
 import argparse
+import codecs
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial, lru_cache
 import logging
 import os
 from os.path import join, relpath, basename, dirname, exists, isdir
 from pathlib import PurePath
+import re
 import shutil
 import shlex
 import subprocess
 import sys
 import textwrap
+import threading
 from time import perf_counter
-from urllib.parse import urlparse
+from urllib.parse import quote, urlparse
 
+from west._state import read_state, write_state
 from west.configuration import config, update_config
 from west import log
+from west import trace
 from west import util
 from west.commands import WestCommand, CommandError
 from west.manifest import ImportFlag, Manifest, MANIFEST_PROJECT_INDEX, \
-    ManifestProject, _manifest_content_at, ManifestImportFailed, \
-    _ManifestImportDepth, ManifestVersionError, MalformedManifest
+    Project, ManifestProject, _manifest_content_at, ManifestImportFailed, \
+    _ManifestImportDepth, ManifestVersionError, MalformedManifest, \
+    MalformedConfig, _config_groups, _parse_group_filter
 from west.manifest import MANIFEST_REV_BRANCH as MANIFEST_REV
 from west.manifest import QUAL_MANIFEST_REV_BRANCH as QUAL_MANIFEST_REV
 from west.manifest import QUAL_REFS_WEST as QUAL_REFS
@@ -64,6 +71,31 @@ class _ProjectCommand(WestCommand):
         else:
             return [p for p in self.manifest.projects if p.is_cloned()]
 
+    def _load_manifest(self, **kwargs):
+        # Parse the workspace's manifest from scratch, passing kwargs
+        # on to the Manifest constructor. What we already know about
+        # the workspace is reused if we can.
+
+        if self._workspace is not None:
+            return self._workspace.load_manifest(**kwargs)
+        return Manifest.from_file(topdir=self.topdir, **kwargs)
+
+    def _config_groups(self):
+        # The parsed update.groups configuration option.
+
+        if self._workspace is not None:
+            return self._workspace.group_filter
+        return _config_groups(self.topdir)
+
+    def claimed_paths(self):
+        # Absolute paths of all projects in the manifest, if we have
+        # one. While imports are being resolved, this only covers the
+        # projects which are known so far.
+
+        if not self.has_manifest:
+            return set()
+        return {p.abspath for p in self.manifest.projects if p.abspath}
+
     def _projects(self, ids, only_cloned=False):
         try:
             return self.manifest.get_projects(ids, only_cloned=only_cloned)
@@ -76,10 +108,7 @@ class _ProjectCommand(WestCommand):
             if unknown:
                 die_unknown(unknown)
             elif only_cloned and uncloned:
-                s = 's' if len(uncloned) > 1 else ''
-                names = ' '.join(p.name for p in uncloned)
-                log.die(f'uncloned project{s}: {names}.\n'
-                        '  Hint: run "west update" and retry.')
+                die_uncloned(uncloned)
             else:
                 # Should never happen, but re-raise to fail fast and
                 # preserve a stack trace, to encourage a bug report.
@@ -110,7 +139,16 @@ class _ProjectCommand(WestCommand):
             level = logging.INFO
 
         logger.setLevel(level)
-        logger.addHandler(ProjectCommandLogHandler())
+        # Commands can run more than once per process, as they do in
+        # 'west daemon'. Don't print each message more than once.
+        if not any(isinstance(handler, ProjectCommandLogHandler)
+                   for handler in logger.handlers):
+            logger.addHandler(ProjectCommandLogHandler())
+
+class _OfflineError(RuntimeError):
+    # Raised by 'west update --offline' when a project can't be
+    # updated without the network. The argument is a message.
+    pass
 
 class Init(_ProjectCommand):
 
@@ -150,7 +188,8 @@ class Init(_ProjectCommand):
 
             The default revision in this repository to check out is
             "{MANIFEST_REV_DEFAULT}"; override with --mr.'''),
-            requires_workspace=False)
+            requires_workspace=False,
+            requires_manifest=False)
 
     def do_add_parser(self, parser_adder):
         parser = self._parser(parser_adder)
@@ -165,6 +204,17 @@ class Init(_ProjectCommand):
                             help='''use an existing local manifest repository
                             instead of cloning one; cannot be combined with
                             -m or --mr.''')
+        parser.add_argument('--reference', metavar='WORKSPACE',
+                            help='''borrow git objects from the projects in
+                            another west workspace, matched by URL or name,
+                            instead of downloading them again; as with
+                            "git clone --reference", that workspace must
+                            not be deleted while this one uses it''')
+        parser.add_argument('--from-bundle', metavar='BUNDLE',
+                            help='''create the workspace and all of its
+                            projects from a directory made by "west bundle
+                            create", without using the network; cannot be
+                            combined with -l, -m, or --mr''')
 
         parser.add_argument(
             'directory', nargs='?', default=None,
@@ -192,6 +242,20 @@ class Init(_ProjectCommand):
 
         if args.local and (args.manifest_url or args.manifest_rev):
             log.die('-l cannot be combined with -m or --mr')
+        if args.from_bundle and (args.local or args.manifest_url or
+                                 args.manifest_rev):
+            log.die('--from-bundle cannot be combined with -l, -m, or --mr')
+        if args.from_bundle and args.reference:
+            log.die('--from-bundle cannot be combined with --reference')
+        if args.reference:
+            try:
+                self.reference = util.west_topdir(args.reference,
+                                                  fall_back=False)
+            except util.WestNotFound:
+                log.die(f'--reference {args.reference} is not inside '
+                        'a west workspace')
+        else:
+            self.reference = None
 
         die_if_no_git()
 
@@ -199,6 +263,10 @@ class Init(_ProjectCommand):
 
         if args.local:
             topdir = self.local(args)
+        elif args.from_bundle:
+            topdir = self.from_bundle(args)
+            log.banner(f'Initialized from bundle in {topdir}.')
+            return
         else:
             topdir = self.bootstrap(args)
 
@@ -226,6 +294,7 @@ class Init(_ProjectCommand):
         self.create(west_dir)
         os.chdir(topdir)
         update_config('manifest', 'path', rel_manifest)
+        self.save_reference(topdir)
 
         return topdir
 
@@ -290,6 +359,63 @@ class Init(_ProjectCommand):
             log.die(e)
         log.small_banner('setting manifest.path to', manifest_path)
         update_config('manifest', 'path', manifest_path, topdir=topdir)
+        self.save_reference(topdir)
+
+        return topdir
+
+    def save_reference(self, topdir):
+        # Save the --reference workspace in the new workspace's
+        # configuration, where _init_project() can find it.
+
+        if self.reference:
+            log.small_banner('setting update.reference to', self.reference)
+            update_config('update', 'reference', self.reference,
+                          topdir=topdir)
+
+    def from_bundle(self, args):
+        bundle = util.canon_path(args.from_bundle)
+        frozen_manifest = join(bundle, BUNDLE_MANIFEST)
+        topdir = util.canon_path(args.directory or os.getcwd())
+        west_dir = join(topdir, WEST_DIR)
+
+        if not exists(frozen_manifest):
+            log.die(f"can't init: {bundle} is not a west bundle directory\n"
+                    '  Hint: create one with "west bundle create"')
+
+        try:
+            already = util.west_topdir(topdir, fall_back=False)
+            self.die_already(already)
+        except util.WestNotFound:
+            pass
+
+        log.banner('Initializing in', topdir, 'from bundle', bundle)
+        if not isdir(topdir):
+            self.create(topdir, exist_ok=False)
+
+        # The frozen manifest has no imports and only SHA revisions,
+        # so it tells us everything we need to create each project.
+        projects = Manifest.from_file(frozen_manifest,
+                                      import_flags=ImportFlag.IGNORE,
+                                      topdir=topdir).projects
+        manifest_path = projects[MANIFEST_PROJECT_INDEX].path or 'manifest'
+
+        log.small_banner(f'Cloning manifest repository to {manifest_path}')
+        manifest_abspath = join(topdir, manifest_path)
+        self.check_call(('git', 'clone', '--',
+                         join(bundle, BUNDLE_MANIFEST_REPO), manifest_abspath))
+        # Don't leave a remote pointing at the bundle behind.
+        self.check_call(('git', 'remote', 'remove', 'origin'),
+                        cwd=manifest_abspath)
+
+        self.create(west_dir)
+        update_config('manifest', 'path', manifest_path, topdir=topdir)
+
+        projects = projects[MANIFEST_PROJECT_INDEX + 1:]
+        with ThreadPoolExecutor() as executor:
+            results = list(executor.map(
+                partial(_unbundle_project, bundle, topdir), projects))
+        self._handle_failed(args, [project for project, ok in
+                                   zip(projects, results) if not ok])
 
         return topdir
 
@@ -307,7 +433,12 @@ class Init(_ProjectCommand):
         cmd_str = util.quote_sh_list(args)
         log.dbg(f"running '{cmd_str}' in {cwd or os.getcwd()}",
                 level=log.VERBOSE_VERY)
-        subprocess.check_call(args, cwd=cwd)
+        start = perf_counter()
+        returncode = subprocess.call(args, cwd=cwd)
+        trace.record_git_call(args, cwd, start, returncode,
+                              project='manifest')
+        if returncode:
+            raise subprocess.CalledProcessError(returncode, args)
 
     def clone_manifest(self, url, rev, dest, exist_ok=False):
         log.small_banner(f'Cloning manifest repository from {url}, rev. {rev}')
@@ -317,6 +448,12 @@ class Init(_ProjectCommand):
         self.check_call(('git', 'init', dest))
         self.check_call(('git', 'remote', 'add', 'origin', '--', url),
                         cwd=dest)
+        if self.reference:
+            manifest = _reference_manifest(self.reference)
+            if manifest is not None:
+                mp = manifest.projects[MANIFEST_PROJECT_INDEX]
+                _add_alternate(dest, join(mp.abspath, _git_path(mp,
+                                                                'objects')))
         maybe_sha = _maybe_sha(rev)
         if maybe_sha:
             # Fetch the ref-space and hope the SHA is contained in
@@ -396,21 +533,26 @@ class List(_ProjectCommand):
         return parser
 
     def do_run(self, args, user_args):
-        def sha_thunk(project):
-            die_if_no_git()
+        states = {}
 
-            if not project.is_cloned():
+        def state(project):
+            if project.name not in states:
+                die_if_no_git()
+                # Neither format key needs the working tree scanned.
+                states[project.name] = project.state(full=False)
+            return states[project.name]
+
+        def sha_thunk(project):
+            if not state(project).cloned:
                 log.die(f'cannot get sha for uncloned project {project.name}; '
                         f'run "west update {project.name}" and retry')
-            elif project.revision:
-                return project.sha(MANIFEST_REV)
+            elif project.revision and state(project).manifest_rev:
+                return state(project).manifest_rev
             else:
                 return f'{"N/A":40}'
 
         def cloned_thunk(project):
-            die_if_no_git()
-
-            return "cloned" if project.is_cloned() else "not-cloned"
+            return "cloned" if state(project).cloned else "not-cloned"
 
         def delay(func, project):
             return DelayFormat(partial(func, project))
@@ -519,7 +661,7 @@ class ManifestCommand(_ProjectCommand):
         # errors and printing useful messages. We re-do error checking
         # for manifest-related errors that it won't handle.
         try:
-            manifest = Manifest.from_file(topdir=self.topdir)
+            manifest = self._load_manifest()
         except _ManifestImportDepth:
             log.die("cannot resolve manifest -- is there a loop?")
         except (MalformedManifest, ManifestImportFailed,
@@ -571,18 +713,28 @@ class Diff(_ProjectCommand):
 
         for project in self._cloned_projects(args):
             # Use paths that are relative to the base directory to make it
-            # easier to see where the changes are
-            cp = project.git(['diff', f'--src-prefix={project.path}/',
-                              f'--dst-prefix={project.path}/',
-                              '--exit-code'] + color,
-                             capture_stdout=True, capture_stderr=True,
-                             check=False)
-            if cp.returncode == 0:
+            # easier to see where the changes are. The diff is written
+            # out as it arrives, so big ones don't pile up in memory.
+            stream = project.git_stream(['diff',
+                                         f'--src-prefix={project.path}/',
+                                         f'--dst-prefix={project.path}/',
+                                         '--exit-code'] + color)
+            # Write the diff through sys.stdout, not its buffer, so
+            # colorama can strip the colors if stdout isn't a terminal.
+            decoder = codecs.getincrementaldecoder('utf-8')('replace')
+            banner = False
+            for chunk in stream:
+                if not banner:
+                    log.banner(f'diff for {project.name_and_path}:')
+                    banner = True
+                sys.stdout.write(decoder.decode(chunk))
+            sys.stdout.write(decoder.decode(b'', final=True))
+            sys.stdout.flush()
+            if stream.returncode == 0:
                 no_diff += 1
-            if cp.returncode == 1 or log.VERBOSE > log.VERBOSE_NONE:
-                log.banner(f'diff for {project.name_and_path}:')
-                log.inf(cp.stdout.decode('utf-8'))
-            elif cp.returncode:
+                if not banner and log.VERBOSE > log.VERBOSE_NONE:
+                    log.banner(f'diff for {project.name_and_path}:')
+            elif stream.returncode != 1:
                 failed.append(project)
         if failed:
             self._handle_failed(args, failed)
@@ -605,8 +757,19 @@ class Status(_ProjectCommand):
         die_if_no_git()
         self._setup_logging(args)
 
+        # Explicitly given projects must be cloned; others which
+        # aren't are skipped.
+        projects = self._projects(args.projects)
+        states = [project.state(full=False) for project in projects]
+        uncloned = [p for p, state in zip(projects, states)
+                    if not state.cloned]
+        if args.projects and uncloned:
+            die_uncloned(uncloned)
+
         failed = []
-        for project in self._cloned_projects(args):
+        for project, state in zip(projects, states):
+            if not state.cloned:
+                continue
             log.banner(f'status of {project.name_and_path}:')
             try:
                 project.git('status', extra_args=user_args)
@@ -642,6 +805,15 @@ class Update(_ProjectCommand):
         parser.add_argument('--stats', action='store_true',
                             help='''print performance statistics for
                             update operations''')
+        parser.add_argument('-g', '--group', dest='groups', action='append',
+                            metavar='[+|-]GROUP',
+                            help='''enable (GROUP or +GROUP) or disable
+                            (-GROUP) a project group, overriding the
+                            update.groups configuration option; may be
+                            given more than once or as a comma-separated
+                            list (use --group=-GROUP to disable one).
+                            Projects whose groups are all disabled are
+                            not updated''')
 
         group = parser.add_argument_group(
             title='fetching behavior',
@@ -653,6 +825,18 @@ class Update(_ProjectCommand):
                            while "smart" (default) skips fetching projects
                            whose revisions are SHAs or tags available
                            locally''')
+        group.add_argument('-j', '--jobs', type=int, metavar='N',
+                           help='''number of projects to fetch, and to
+                           check out, at once; overrides the
+                           update.fetch-jobs and update.checkout-jobs
+                           configuration options (default: 1). With more
+                           than one, projects which took longest last time
+                           go first''')
+        group.add_argument('-o', '--offline', action='store_true',
+                           help='''never fetch; resolve revisions using
+                           only what's available locally, such as
+                           manifest-rev after "west fetch", and fail
+                           for projects where that isn't enough''')
 
         group = parser.add_argument_group(
             title='checked out branch behavior',
@@ -683,10 +867,28 @@ class Update(_ProjectCommand):
         self.args = args
         if args.exclude_west:
             log.wrn('ignoring --exclude-west')
+        if args.offline and args.fetch_strategy == 'always':
+            self.parser.error('--offline and --fetch=always '
+                              'cannot be combined')
+        if args.jobs is not None and args.jobs < 1:
+            self.parser.error(f'invalid --jobs {args.jobs}; must be positive')
+        self.fetch_jobs = args.jobs or _update_jobs('fetch-jobs')
+        self.checkout_jobs = args.jobs or _update_jobs('checkout-jobs')
+        self.updated = set()
+        # The history is only used to schedule parallel updates, and
+        # getting each project's size takes another git command.
+        self.record_history = self.fetch_jobs > 1 or self.checkout_jobs > 1
+        self.history = {}
+        self.locations = {}
+        self.pools = _pools_enabled()
+        self.import_fetch = _import_fetch_mode()
+        try:
+            self.group_filter = self._config_groups()
+            for arg in args.groups or []:
+                self.group_filter.extend(_parse_group_filter(arg))
+        except (MalformedConfig, ValueError) as e:
+            log.die(e)
 
-        # We can't blindly call self._projects() here: manifests with
-        # imports are limited to plain 'west update', and cannot use
-        # 'west update PROJECT [...]'.
         self.fs = self.fetch_strategy(args)
         if not args.projects:
             self.update_all(args)
@@ -703,41 +905,47 @@ class Update(_ProjectCommand):
         # call our importer whenever it encounters an import statement
         # in a project, allowing us to control the recursion so it
         # always uses the latest manifest data.
-        self.updated = set()
-        self.args = args
-
-        manifest = Manifest.from_file(importer=self.update_importer,
-                                      import_flags=ImportFlag.FORCE_PROJECTS)
+        manifest = self._load_manifest(importer=self.update_importer,
+                                       import_flags=ImportFlag.FORCE_PROJECTS,
+                                       group_filter=self.group_filter)
 
-        failed = []
-        for project in manifest.projects:
-            if (isinstance(project, ManifestProject) or
-                    project.name in self.updated):
-                continue
-            try:
-                self.update(project)
-                self.updated.add(project.name)
-            except subprocess.CalledProcessError:
-                failed.append(project)
+        failed = self.update_projects(
+            [p for p in manifest.projects if not
+             (isinstance(p, ManifestProject) or p.name in self.updated)])
         self._handle_failed(args, failed)
 
     def update_importer(self, project, path):
+        # With update.import-fetch=filter, a project which isn't
+        # cloned yet gets just enough fetched into a scratch
+        # repository to read its manifest data. It is cloned and
+        # checked out later, along with everything else.
+        source, rev = project, QUAL_MANIFEST_REV
         if isinstance(project, ManifestProject):
             if not project.is_cloned():
                 log.die("manifest repository {project.abspath} was deleted")
+            self.updated.add(project.name)
         else:
-            self.update(project)
-        self.updated.add(project.name)
+            if (self.import_fetch == 'filter' and not self.args.offline and
+                    not project.is_cloned()):
+                source = _filtered_import_fetch(project) or project
+            if source is not project:
+                rev = QUAL_IMPORT_REF
+            else:
+                try:
+                    self.update(project)
+                except _OfflineError as oe:
+                    log.die(*oe.args)
+                self.updated.add(project.name)
 
         try:
-            return _manifest_content_at(project, path)
+            return _manifest_content_at(source, path, rev=rev)
         except FileNotFoundError:
             # FIXME we need each project to have back-pointers
             # to the manifest file where it was defined, so we can
             # tell the user better context than just "run -vvv", which
             # is a total fire hose.
             name = project.name
-            sha = project.sha(QUAL_MANIFEST_REV)
+            sha = source.sha(rev)
             if log.VERBOSE < log.VERBOSE_EXTREME:
                 suggest_vvv = ('\n'
                                '        Use "west -vvv update" to debug.')
@@ -749,68 +957,157 @@ class Update(_ProjectCommand):
                     f'          - set "revision:" to a git ref with this file '
                     f'at URL {project.url}\n'
                     '          - remove the "import:"' + suggest_vvv)
+        finally:
+            if source is not project:
+                shutil.rmtree(source.abspath, ignore_errors=True)
 
     def update_some(self, args):
-        # The 'west update PROJECT [...]' style invocation is only
-        # implemented for projects defined within the manifest
-        # repository.
-        #
-        # It's unclear how to do this properly in the case of
-        # a project A whose definition is imported from
-        # another project B, especially when B.revision is not
-        # a fixed SHA. Do we forcibly need to update B first?
-        # Should we skip it? Should it be configurable? Etc.
+        # The 'west update PROJECT [...]' style invocation.
         #
-        # For now, just refuse to do so. We can try to relax
-        # this restriction if it proves cumbersome.
+        # Projects defined in the manifest repository are easy. For a
+        # project A whose definition is imported from another project
+        # B, B must be updated first, since A's definition (and even
+        # whether A exists) can change when B's manifest-rev does.
+        # That's handled by imported_projects().
+
+        if args.groups and self.has_manifest:
+            # The manifest we were given only knows about update.groups.
+            try:
+                self.manifest = self._load_manifest(
+                    group_filter=self.group_filter)
+            except ManifestImportFailed:
+                # The manifest has imports, so imported_projects()
+                # will be used below anyway.
+                pass
 
         if not self.has_manifest or self.manifest.has_imports:
-            projects = self.toplevel_projects(args)
+            projects = self.imported_projects(args)
         else:
             projects = self._projects(args.projects)
 
-        failed = []
-        for project in projects:
-            if isinstance(project, ManifestProject):
-                continue
+        failed = self.update_projects(
+            [p for p in projects if not
+             (isinstance(p, ManifestProject) or p.name in self.updated)])
+        self._handle_failed(args, failed)
+
+    def update_projects(self, projects):
+        # Update each project in the list, returning the ones which
+        # failed.
+        #
+        # If more than one job is allowed, the projects go through a
+        # pipeline instead: a pool of fetch_jobs workers runs the
+        # network-bound fetch stage, and hands each project it's done
+        # with over to a pool of checkout_jobs workers, which runs the
+        # disk-bound working tree stage. To keep a few big projects
+        # which happen to come last from dominating the total time,
+        # the ones which took longest last time are started first.
+
+        def update_one(project):
             try:
                 self.update(project)
             except subprocess.CalledProcessError:
-                failed.append(project)
-        self._handle_failed(args, failed)
+                return False
+            except _OfflineError as oe:
+                log.err(*oe.args)
+                return False
+            self.updated.add(project.name)
+            return True
+
+        def fetch_one(project):
+            # Returns a future for the checkout stage, or None if
+            # the fetch stage failed.
+            stats = dict() if self.args.stats else None
+            try:
+                with trace.span(f'fetch {project.name}', cat='update'):
+                    seconds = self.fetch_stage(project, stats)
+            except subprocess.CalledProcessError:
+                return None
+            except _OfflineError as oe:
+                log.err(*oe.args)
+                return None
+            return checkouts.submit(checkout_one, project, stats, seconds)
 
-    def toplevel_projects(self, args):
+        def checkout_one(project, stats, seconds):
+            try:
+                with trace.span(f'checkout {project.name}', cat='update'):
+                    self.checkout_stage(project, stats, seconds)
+            except subprocess.CalledProcessError:
+                return False
+            self.updated.add(project.name)
+            return True
+
+        if self.fetch_jobs == 1 and self.checkout_jobs == 1:
+            results = [update_one(project) for project in projects]
+        else:
+            projects = _lpt_order(projects, read_state(
+                self.topdir, UPDATE_HISTORY))
+            with ThreadPoolExecutor(max_workers=self.checkout_jobs) as \
+                    checkouts:
+                with ThreadPoolExecutor(max_workers=self.fetch_jobs) as \
+                        fetches:
+                    futures = list(fetches.map(fetch_one, projects))
+                results = [future is not None and future.result()
+                           for future in futures]
+
+        if self.history:
+            _update_west_state(self.topdir, UPDATE_HISTORY, self.history)
+        _update_west_state(self.topdir, PROJECT_LOCATIONS, self.locations)
+        return [project for project, ok in zip(projects, results) if not ok]
+
+    def imported_projects(self, args):
         # Return a list of projects from args.projects, or scream and
-        # die if any projects are either unknown or not defined in the
-        # manifest repository.
+        # die if any projects are unknown, after updating the projects
+        # whose imports they were resolved from, in dependency order.
+        #
+        # Updating an import provider can change the rest of the
+        # chain, so keep resolving the manifest until every provider
+        # of the requested projects is up to date. Each round updates
+        # at least one more provider, so this terminates.
 
         ids = args.projects
         assert ids
 
+        # Projects defined in the manifest repository don't need any
+        # providers updated.
         mr_projects, mr_unknown = projects_unknown(
-            Manifest.from_file(import_flags=ImportFlag.IGNORE_PROJECTS), ids)
-
+            self._load_manifest(import_flags=ImportFlag.IGNORE_PROJECTS,
+                                group_filter=self.group_filter), ids)
         if not mr_unknown:
             return mr_projects
 
-        try:
-            manifest = Manifest.from_file()
-        except ManifestImportFailed:
-            log.die('one or more projects are unknown or defined via '
-                    'imports; please run plain "west update".')
+        while True:
+            # update_importer() updates any providers whose manifest
+            # data we don't have yet.
+            manifest = self._load_manifest(importer=self.update_importer,
+                                           group_filter=self.group_filter)
+            projects, unknown = projects_unknown(manifest, ids)
+            if unknown:
+                die_unknown(unknown)
 
-        projects, unknown = projects_unknown(manifest, ids)
-        if unknown:
-            die_unknown(unknown)
-        else:
-            # All of the ids are known projects, but some of them
-            # are not defined in the manifest repository.
-            mr_unknown_set = set(mr_unknown)
-            from_projects = [p for p in ids if p in mr_unknown_set]
-            log.die('refusing to update project: ' +
-                    " ".join(from_projects) + '\n' +
-                    '  It or they were resolved via project imports.\n'
-                    '  Only plain "west update" can currently update them.')
+            providers = {provider.name for project in projects
+                         for provider in manifest._import_chain(project)}
+            # Manifest order puts each provider before the projects
+            # it provides.
+            stale = [p for p in manifest.projects
+                     if p.name in providers and p.name not in self.updated]
+            if not stale:
+                return projects
+
+            # Only update providers whose own providers were already
+            # up to date when the manifest was resolved. The others'
+            # revisions may change once those are updated, so they
+            # have to wait for the next round. There's always at least
+            # one: the first in 'stale'.
+            up_to_date = set(self.updated)
+            for provider in stale:
+                if any(p.name not in up_to_date
+                       for p in manifest._import_chain(provider)):
+                    continue
+                try:
+                    self.update(provider)
+                except _OfflineError as oe:
+                    log.die(*oe.args)
+                self.updated.add(provider.name)
 
     def fetch_strategy(self, args):
         cfg = config.get('update', 'fetch', fallback=None)
@@ -827,15 +1124,27 @@ class Update(_ProjectCommand):
 
     def fetch_missing_imports(self, args):
         self.fs = 'always'      # just to be safe -- TODO needed?
-        self.manifest = Manifest.from_file(topdir=self.topdir,
-                                           importer=self.update_importer)
+        self.manifest = self._load_manifest(importer=self.update_importer,
+                                            group_filter=self.group_filter)
 
     def update(self, project):
-        if self.args.stats:
-            stats = dict()
-            update_start = perf_counter()
-        else:
-            stats = None
+        # Update a project by running both stages, one after the other.
+
+        stats = dict() if self.args.stats else None
+        with trace.span(f'update {project.name}', cat='update'):
+            with trace.span(f'fetch {project.name}', cat='update'):
+                seconds = self.fetch_stage(project, stats)
+            with trace.span(f'checkout {project.name}', cat='update'):
+                self.checkout_stage(project, stats, seconds)
+
+    def fetch_stage(self, project, stats):
+        # The network-bound half of updating a project: make sure it's
+        # cloned and that manifest-rev points at project.revision.
+        # Returns how long this took, in seconds.
+        #
+        # If stats is not None, timing information is stored in it.
+
+        fetch_start = perf_counter()
         take_stats = stats is not None
 
         log.banner(f'updating {project.name_and_path}:')
@@ -853,17 +1162,43 @@ class Update(_ProjectCommand):
         # versions of west that left refs in place here.
         self.clean_refs_west(project, stats, take_stats)
 
+        # Share objects with other forks of the project, if enabled.
+        if self.pools:
+            if take_stats:
+                start = perf_counter()
+            _pool_objects(project)
+            if take_stats:
+                stats['share objects with forks'] = perf_counter() - start
+
+        return perf_counter() - fetch_start
+
+    def checkout_stage(self, project, stats, fetch_seconds):
+        # The disk-bound half of updating a project, after
+        # fetch_stage(): check out the new manifest-rev, or rebase or
+        # keep the current branch. fetch_seconds is how long
+        # fetch_stage() took.
+
+        checkout_start = perf_counter()
+        take_stats = stats is not None
+
+        # Find out where HEAD and manifest-rev are, all at once.
+        if take_stats:
+            start = perf_counter()
+        state = project.state()
+        if take_stats:
+            stats['get project state'] = perf_counter() - start
+
         # Make sure HEAD is pointing at *something*.
-        self.ensure_head_ok(project, stats, take_stats)
+        state = self.ensure_head_ok(project, state, stats, take_stats)
 
         # Convert manifest-rev to a SHA.
-        sha = self.manifest_rev_sha(project, stats, take_stats)
+        sha = self.manifest_rev_sha(project, state)
 
         # Based on the new manifest-rev SHA, HEAD, and the --rebase
         # and --keep-descendants options, decide what we need to do
         # now.
         current_branch, is_ancestor, try_rebase = self.decide_update_strategy(
-            project, sha, stats, take_stats)
+            state)
 
         # Finish the update. This may be a nop if we're keeping
         # descendants.
@@ -895,9 +1230,10 @@ class Update(_ProjectCommand):
                 stats['checkout new manifest-rev'] = perf_counter() - start
             _post_checkout_help(project, current_branch, sha, is_ancestor)
 
+        update_total = fetch_seconds + perf_counter() - checkout_start
+
         # Print performance statistics.
         if take_stats:
-            update_total = perf_counter() - update_start
             slop = update_total - sum(stats.values())
             stats['other work'] = slop
             stats['TOTAL'] = update_total
@@ -905,8 +1241,14 @@ class Update(_ProjectCommand):
             for stat, value in stats.items():
                 log.inf(f'  {stat}: {value} sec')
 
-    @staticmethod
-    def ensure_cloned(project, stats, take_stats):
+        # Remember how long this took, for scheduling next time, and
+        # where the project is, in case its path changes.
+        if self.record_history:
+            self.history[project.name] = _history_entry(project,
+                                                        update_total)
+        self.locations[project.name] = _location_entry(project)
+
+    def ensure_cloned(self, project, stats, take_stats):
         # update() helper. Make sure project is cloned and initialized.
 
         if take_stats:
@@ -915,6 +1257,16 @@ class Update(_ProjectCommand):
         if take_stats:
             stats['check if cloned'] = perf_counter() - start
         if not cloned:
+            if take_stats:
+                start = perf_counter()
+            moved = _move_old_clone(project, self.claimed_paths())
+            if take_stats:
+                stats['check for clone at old path'] = perf_counter() - start
+            if moved:
+                return
+            if self.args.offline:
+                raise _OfflineError(f'{project.name}: not cloned, and '
+                                    'cloning requires the network')
             if take_stats:
                 start = perf_counter()
             _init_project(project)
@@ -925,7 +1277,14 @@ class Update(_ProjectCommand):
         # update() helper. Make sure project's manifest-rev is set to
         # the latest value it should be.
 
-        if self.fs == 'always' or _rev_type(project) not in ('tag', 'commit'):
+        if self.args.offline:
+            if take_stats:
+                start = perf_counter()
+            _update_manifest_rev(project, _offline_manifest_rev(project))
+            if take_stats:
+                stats['set manifest-rev'] = perf_counter() - start
+        elif (self.fs == 'always' or
+              _rev_type(project) not in ('tag', 'commit')):
             if take_stats:
                 start = perf_counter()
             _fetch(project)
@@ -959,15 +1318,11 @@ class Update(_ProjectCommand):
             stats['clean up refs/west/*'] = perf_counter() - start
 
     @staticmethod
-    def ensure_head_ok(project, stats, take_stats):
-        # update() helper. Ensure HEAD points at something reasonable.
+    def ensure_head_ok(project, state, stats, take_stats):
+        # update() helper. Ensure HEAD points at something reasonable,
+        # returning the project's state afterwards.
 
-        if take_stats:
-            start = perf_counter()
-        head_ok = _head_ok(project)
-        if take_stats:
-            stats['check HEAD is ok'] = perf_counter() - start
-        if not head_ok:
+        if state.head is None:
             # If nothing is checked out (which usually only happens if
             # we called _init_project(project) above), check out
             # 'manifest-rev' in a detached HEAD state.
@@ -975,9 +1330,7 @@ class Update(_ProjectCommand):
             # Otherwise, the initial state would have nothing checked
             # out, and HEAD would point to a non-existent
             # refs/heads/master branch (that would get created if the
-            # user makes an initial commit). Among other things, this
-            # ensures the rev-parse --abbrev-ref HEAD which happens
-            # later in the update() will always succeed.
+            # user makes an initial commit).
             #
             # The --detach flag is strictly redundant here, because
             # the refs/heads/<branch> form already detaches HEAD, but
@@ -987,49 +1340,216 @@ class Update(_ProjectCommand):
             project.git('checkout --detach ' + QUAL_MANIFEST_REV)
             if take_stats:
                 stats['checkout new manifest-rev'] = perf_counter() - start
+            state = state._replace(head=state.manifest_rev, branch=None,
+                                   is_ancestor=True)
+        return state
 
     @staticmethod
-    def manifest_rev_sha(project, stats, take_stats):
+    def manifest_rev_sha(project, state):
         # update() helper. Get the SHA for manifest-rev.
 
-        try:
-            if take_stats:
-                start = perf_counter()
-            return project.sha(QUAL_MANIFEST_REV)
-            if take_stats:
-                stats['get new manifest-rev SHA'] = perf_counter() - start
-        except subprocess.CalledProcessError:
+        if state.manifest_rev is None:
             # This is a sign something's really wrong. Add more help.
             log.err(f'no SHA for branch {MANIFEST_REV} '
                     f'in {project.name_and_path}; was the branch deleted?')
-            raise
+            raise subprocess.CalledProcessError(
+                1, ['rev-parse', QUAL_MANIFEST_REV])
+        return state.manifest_rev
 
-    def decide_update_strategy(self, project, sha, stats, take_stats):
+    def decide_update_strategy(self, state):
         # update() helper. Decide on whether we have an ancestor
         # branch or whether we should try to rebase.
 
-        if take_stats:
-            start = perf_counter()
-        cp = project.git('rev-parse --abbrev-ref HEAD', capture_stdout=True)
-        if take_stats:
-            stats['get current branch HEAD'] = perf_counter() - start
-        current_branch = cp.stdout.decode('utf-8').strip()
-        if current_branch != 'HEAD':
-            if take_stats:
-                start = perf_counter()
-            is_ancestor = project.is_ancestor_of(sha, current_branch)
-            if take_stats:
-                stats['check if HEAD is ancestor of manifest-rev'] = \
-                    perf_counter() - start
+        if state.branch is not None:
+            current_branch = state.branch
+            is_ancestor = bool(state.is_ancestor)
             try_rebase = self.args.rebase
-        else:  # HEAD means no branch is checked out.
-            # If no branch is checked out, 'rebase' and
-            # 'keep_descendants' don't matter.
+        else:
+            # 'HEAD' means no branch is checked out. In that case,
+            # 'rebase' and 'keep_descendants' don't matter.
+            current_branch = 'HEAD'
             is_ancestor = False
             try_rebase = False
 
         return current_branch, is_ancestor, try_rebase
 
+class Fetch(_ProjectCommand):
+
+    def __init__(self):
+        super().__init__(
+            'fetch',
+            'fetch project revisions without updating working trees',
+            textwrap.dedent('''\
+            Fetches each project's revision in the manifest file,
+            west.yml, and points its manifest-rev branch at it, without
+            touching the working tree, index, or HEAD of any project.
+
+            Projects which are not cloned yet are initialized, but
+            nothing is checked out in them. Manifest imports are
+            resolved from the newly fetched manifest-rev commits.
+
+            Run "west update" afterwards to check out what was fetched.
+            Since the revisions are available locally, that doesn't
+            need to use the network unless a revision is a branch.'''))
+
+    def do_add_parser(self, parser_adder):
+        parser = self._parser(parser_adder)
+        parser.add_argument('-j', '--jobs', type=int, metavar='N',
+                            help='''number of projects to fetch at once
+                            (default: chosen by Python based on the
+                            number of CPUs)''')
+        self._add_projects_arg(parser)
+        return parser
+
+    def do_run(self, args, user_args):
+        die_if_no_git()
+        self._setup_logging(args)
+
+        if args.jobs is not None and args.jobs < 1:
+            self.parser.error(f'invalid --jobs {args.jobs}; must be positive')
+
+        # Resolving imports requires the projects they come from to
+        # be fetched first, which importer() does as it goes, in
+        # order. Everything else can be fetched in parallel.
+        self.fetched = set()
+        self.failed = []
+        # As in Update, the history is only needed for parallel fetches.
+        self.record_history = args.jobs != 1
+        self.history = {}
+        self.locations = {}
+        self.pools = _pools_enabled()
+        if args.projects:
+            projects = self._projects(args.projects)
+        else:
+            manifest = self._load_manifest(
+                importer=self.importer,
+                import_flags=ImportFlag.FORCE_PROJECTS)
+            projects = manifest.projects
+
+        # Start the projects which took longest last time first.
+        projects = _lpt_order(
+            [p for p in projects if not
+             (isinstance(p, ManifestProject) or p.name in self.fetched)],
+            read_state(self.topdir, UPDATE_HISTORY))
+        with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            for project, ok in zip(projects,
+                                   executor.map(self.fetch, projects)):
+                if not ok:
+                    self.failed.append(project)
+        if self.history:
+            _update_west_state(self.topdir, UPDATE_HISTORY, self.history)
+        _update_west_state(self.topdir, PROJECT_LOCATIONS, self.locations)
+        self._handle_failed(args, self.failed)
+
+    def importer(self, project, path):
+        if not isinstance(project, ManifestProject):
+            if not self.fetch(project):
+                log.die(f"can't resolve imports from {project.name} "
+                        'without fetching it')
+        self.fetched.add(project.name)
+        return _manifest_content_at(project, path)
+
+    def fetch(self, project):
+        # Make sure project's manifest-rev points at the latest
+        # project.revision. Returns True on success, False on error.
+        #
+        # This runs in worker threads, so it must not touch anything
+        # but the project itself and its self.history entry.
+
+        start = perf_counter()
+        try:
+            if (not project.is_cloned() and
+                    not _move_old_clone(project, self.claimed_paths())):
+                _init_project(project)
+            if _rev_type(project) in ('tag', 'commit'):
+                # Tags and SHAs can't change, so don't bother fetching.
+                _update_manifest_rev(project,
+                                     f'{project.revision}^{{commit}}')
+            else:
+                _fetch(project)
+            _clean_west_refspace(project)
+            if self.pools:
+                _pool_objects(project)
+        except subprocess.CalledProcessError:
+            return False
+        if self.record_history:
+            self.history[project.name] = _history_entry(
+                project, perf_counter() - start)
+        self.locations[project.name] = _location_entry(project)
+        return True
+
+class Bundle(_ProjectCommand):
+
+    def __init__(self):
+        super().__init__(
+            'bundle',
+            'save the workspace for use without the network',
+            textwrap.dedent('''\
+            Saves the current workspace to a directory, so that
+            "west init --from-bundle" can recreate it elsewhere
+            without using the network.
+
+            The only available action is "create". It writes the
+            following to the output directory OUT, which must not
+            exist or be empty:
+
+            - west.yml: the frozen manifest, as from
+              "west manifest --freeze"
+            - manifest.bundle: a git bundle of the manifest
+              repository's HEAD
+            - projects/: a git bundle of each project's manifest-rev
+              history; shallow projects stay shallow
+
+            All projects must be cloned (with "west update").'''))
+
+    def do_add_parser(self, parser_adder):
+        parser = self._parser(parser_adder)
+        parser.add_argument('-j', '--jobs', type=int, metavar='N',
+                            help='''number of projects to bundle at once
+                            (default: chosen by Python based on the
+                            number of CPUs)''')
+        parser.add_argument('action', choices=['create'],
+                            help='what to do')
+        parser.add_argument('out', metavar='OUT',
+                            help='output directory')
+        return parser
+
+    def do_run(self, args, user_args):
+        die_if_no_git()
+        self._setup_logging(args)
+
+        if args.jobs is not None and args.jobs < 1:
+            self.parser.error(f'invalid --jobs {args.jobs}; must be positive')
+
+        out = os.path.abspath(args.out)
+        if exists(out) and (not isdir(out) or os.listdir(out)):
+            log.die(f'refusing to create bundle in {out}: '
+                    'it exists and is not an empty directory')
+
+        try:
+            frozen = self.manifest.as_frozen_yaml(default_flow_style=False,
+                                                  sort_keys=False)
+        except RuntimeError as e:
+            log.die(*e.args, '\n  Hint: run "west update" and retry.')
+
+        os.makedirs(join(out, BUNDLE_PROJECTS_DIR))
+        with open(join(out, BUNDLE_MANIFEST), 'w') as f:
+            f.write(frozen)
+
+        mp = self.manifest.projects[MANIFEST_PROJECT_INDEX]
+        log.small_banner(f'bundling manifest repository {mp.path}')
+        mp.git(['bundle', 'create', join(out, BUNDLE_MANIFEST_REPO), 'HEAD'])
+
+        projects = self.manifest.projects[MANIFEST_PROJECT_INDEX + 1:]
+        with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            results = list(executor.map(partial(_bundle_project, out),
+                                        projects))
+        self._handle_failed(args, [project for project, ok in
+                                   zip(projects, results) if not ok])
+
+        log.inf(f'Created bundle in {out}. Use "west init --from-bundle" '
+                'to create a workspace from it.')
+
 class ForAll(_ProjectCommand):
     def __init__(self):
         super().__init__(
@@ -1065,36 +1585,23 @@ class ForAll(_ProjectCommand):
         for project in self._cloned_projects(args):
             log.banner(
                 f'running "{args.subcommand}" in {project.name_and_path}:')
+            start = perf_counter()
             rc = subprocess.Popen(args.subcommand, shell=True,
                                   cwd=project.abspath).wait()
+            trace.record_git_call([args.subcommand], project.abspath, start,
+                                  rc, project=project.name,
+                                  subcommand='(forall command)')
             if rc:
                 failed.append(project)
         self._handle_failed(args, failed)
 
-class Topdir(_ProjectCommand):
-    def __init__(self):
-        super().__init__(
-            'topdir',
-            'print the top level directory of the workspace',
-            textwrap.dedent('''\
-            Prints the absolute path of the current west workspace's
-            top directory.
-
-            This is the directory containing .west. All project
-            paths in the manifest are relative to this top directory.'''))
-
-    def do_add_parser(self, parser_adder):
-        return self._parser(parser_adder)
-
-    def do_run(self, args, user_args):
-        log.inf(PurePath(self.topdir).as_posix())
-
 class SelfUpdate(_ProjectCommand):
     def __init__(self):
         super().__init__(
             'selfupdate',
             'deprecated; exists for backwards compatibility',
-            'Do not use. You can upgrade west with pip only from v0.6.0.')
+            'Do not use. You can upgrade west with pip only from v0.6.0.',
+            requires_manifest=False)
 
     def do_add_parser(self, parser_adder):
         return self._parser(parser_adder)
@@ -1121,10 +1628,46 @@ def _clean_west_refspace(project):
         project.git(delete_ref_cmd)
 
 def _update_manifest_rev(project, new_manifest_rev):
+    # Point manifest-rev at new_manifest_rev, which must be the commit
+    # project.revision currently resolves to. The reflog message names
+    # project.revision; _offline_manifest_rev() relies on this.
     project.git(['update-ref',
-                 '-m', f'west update: moving to {new_manifest_rev}',
+                 '-m', f'west update: moving to {project.revision}',
                  QUAL_MANIFEST_REV, new_manifest_rev])
 
+def _offline_manifest_rev(project):
+    # Get a local revision which resolves to the commit that
+    # project.revision points at, without using the network.
+    # Raises _OfflineError if there is no such thing.
+
+    rev = project.revision
+    if _rev_type(project) in ('tag', 'commit'):
+        # Tags and SHAs can't change, so any local copy will do.
+        return f'{rev}^{{commit}}'
+
+    # Branches can, so we can't trust a local branch with the same
+    # name. If the last west fetch or update of the project was for
+    # the same revision, manifest-rev is what we want.
+    cp = project.git(['reflog', 'show', '-n', '1', '--format=%gs',
+                      QUAL_MANIFEST_REV, '--'],
+                     check=False, capture_stdout=True, capture_stderr=True)
+    if (cp.returncode == 0 and
+            cp.stdout.decode('utf-8').strip() ==
+            f'west update: moving to {rev}'):
+        return QUAL_MANIFEST_REV
+
+    # Otherwise, try a remote-tracking branch, which the user may
+    # have fetched, or which may come from a shared mirror.
+    remote_ref = f'refs/remotes/{project.remote_name}/{rev}'
+    cp = project.git(['rev-parse', '--verify', '--quiet',
+                      f'{remote_ref}^{{commit}}'],
+                     check=False, capture_stdout=True)
+    if cp.returncode == 0:
+        return remote_ref
+
+    raise _OfflineError(f'{project.name}: no local copy of revision {rev}; '
+                        'run "west fetch" while online first')
+
 def _maybe_sha(rev):
     # Return true if and only if the given revision might be a SHA.
 
@@ -1137,12 +1680,192 @@ def _maybe_sha(rev):
 
 def _init_project(project):
     log.small_banner(f'{project.name}: initializing')
-    project.git(['init', project.abspath], cwd=util.west_topdir())
+    project.git(['init', project.abspath], cwd=project.topdir)
     # This remote is added as a convenience for the user.
     # However, west always fetches project data by URL, not remote name.
     # The user is therefore free to change the URL of this remote.
     project.git(f'remote add -- {project.remote_name} {project.url}')
 
+    # If object pools are enabled, we don't know which one the
+    # project belongs in until it's fetched, so let it borrow from all
+    # of them. This lets the first fetch skip any objects they have.
+    # _pool_objects() drops the others once the project is fetched.
+    if _pools_enabled():
+        for pool in _pools(project.topdir):
+            _add_alternate(project.abspath, join(pool, 'objects'))
+
+    # If this workspace was created with 'west init --reference',
+    # borrow objects from the same project there.
+    reference = config.get('update', 'reference', fallback=None)
+    if reference:
+        objects = _reference_objects(reference, project)
+        if objects:
+            log.small_banner(f'{project.name}: using objects in {objects}')
+            _add_alternate(project.abspath, objects)
+
+@lru_cache(maxsize=None)
+def _reference_manifest(reference):
+    # Get the manifest for a 'west init --reference' workspace, or
+    # None if it can't be loaded. If its imports can't be resolved,
+    # settle for the projects in its manifest repository.
+
+    try:
+        try:
+            return Manifest.from_file(topdir=reference)
+        except ManifestImportFailed:
+            return Manifest.from_file(topdir=reference,
+                                      import_flags=ImportFlag.IGNORE_PROJECTS)
+    except (MalformedManifest, MalformedConfig, ManifestVersionError,
+            ManifestImportFailed, OSError, ValueError) as e:
+        log.wrn(f"can't use objects from reference workspace {reference}: "
+                f"its manifest can't be loaded ({e})")
+        return None
+
+def _reference_objects(reference, project):
+    # Find the object store of the project in the 'reference'
+    # workspace that matches 'project', trying by URL, then by name.
+    # Returns None if there's no match.
+    #
+    # Shallow clones are skipped, like 'git clone --reference' does:
+    # fetches would treat the commits at their shallow boundary as
+    # haves, leaving project without the history behind it.
+
+    manifest = _reference_manifest(reference)
+    if manifest is None:
+        return None
+    candidates = manifest.projects[MANIFEST_PROJECT_INDEX + 1:]
+    for match in [lambda p: p.url == project.url,
+                  lambda p: p.name == project.name]:
+        for candidate in candidates:
+            if (match(candidate) and candidate.is_cloned() and
+                    not _is_shallow(candidate)):
+                return join(candidate.abspath,
+                            _git_path(candidate, 'objects'))
+    return None
+
+def _pools_enabled():
+    # Is the update.pools option set?
+
+    try:
+        return config.getboolean('update', 'pools', fallback=False)
+    except ValueError:
+        log.wrn('ignoring invalid config update.pools='
+                f"{config.get('update', 'pools')}; must be a boolean")
+        return False
+
+def _pools(topdir):
+    # Paths to the existing object pools in the workspace.
+
+    pools_dir = join(topdir, WEST_DIR, POOLS_DIR)
+    if not isdir(pools_dir):
+        return []
+    return sorted(join(pools_dir, pool) for pool in os.listdir(pools_dir)
+                  if pool.endswith('.git'))
+
+def _pool_objects(project):
+    # Move project's objects into the object pool shared with other
+    # forks of the same upstream, i.e. projects with the same root
+    # commit, and make it borrow them from there.
+    #
+    # The pool keeps a ref to each member's manifest-rev, so its
+    # objects stay reachable, and so fetches can use them as "haves"
+    # when negotiating with the remote. Shallow projects are left
+    # alone, as their history doesn't go back to a root commit.
+
+    if _is_shallow(project):
+        return
+
+    # Finding the root commit means walking all of history, so it's
+    # cached by URL.
+    roots = read_state(project.topdir, POOL_ROOTS)
+    root = roots.get(project.url)
+    if root is None:
+        cp = project.git(['rev-list', '--max-parents=0', QUAL_MANIFEST_REV],
+                         capture_stdout=True)
+        # The last root listed is the oldest one.
+        root = cp.stdout.decode('utf-8').split()[-1]
+        _update_west_state(project.topdir, POOL_ROOTS, {project.url: root})
+
+    pool = join(project.topdir, WEST_DIR, POOLS_DIR, f'{root}.git')
+    with _WEST_STATE_LOCK:
+        if not isdir(pool):
+            log.small_banner(f'{project.name}: creating object pool {pool}')
+            project.git(['init', '--bare', '-q', pool])
+            # Objects in the pool are borrowed by its members without
+            # their knowledge, so it must never delete any of them.
+            for option, value in [('gc.auto', '0'),
+                                  ('receive.autogc', 'false'),
+                                  ('gc.pruneExpire', 'never')]:
+                project.git(['config', option, value], cwd=pool)
+    _add_alternate(project.abspath, join(pool, 'objects'))
+
+    # _init_project() let the project borrow from every pool. Now
+    # that we know which one it belongs in, stop borrowing from the
+    # others, so it doesn't pay for looking things up in them, or
+    # break if they are pruned or deleted. Copy in anything it did
+    # borrow from them first.
+    others = [os.path.abspath(join(other, 'objects'))
+              for other in _pools(project.topdir) if other != pool]
+    if set(others) & set(_alternates(project.abspath)):
+        project.git('repack -a -d -q')
+        _remove_alternates(project.abspath, others)
+        repacked = True
+    else:
+        repacked = False
+
+    pool_ref = f'refs/west-pool/{project.name}'
+    sha = project.sha(QUAL_MANIFEST_REV)
+    cp = project.git(['rev-parse', '--verify', '--quiet', pool_ref],
+                     check=False, capture_stdout=True, cwd=pool)
+    if cp.stdout.decode('utf-8').strip() == sha and not repacked:
+        return
+
+    log.small_banner(f'{project.name}: sharing objects in {pool}')
+    project.git(['push', '-q', '-f', pool, f'{sha}:{pool_ref}'])
+    # Now that the pool has them, delete the project's own copies.
+    project.git('repack -a -d -l -q')
+
+def _is_shallow(project):
+    # Is project a shallow clone?
+
+    cp = project.git('rev-parse --is-shallow-repository',
+                     capture_stdout=True)
+    return cp.stdout.decode('utf-8').strip() == 'true'
+
+def _alternates_file(repo):
+    return join(repo, '.git', 'objects', 'info', 'alternates')
+
+def _alternates(repo):
+    # The object stores the git repository at 'repo' borrows from.
+
+    try:
+        with open(_alternates_file(repo), 'r') as f:
+            return f.read().splitlines()
+    except FileNotFoundError:
+        return []
+
+def _add_alternate(repo, objects):
+    # Make the git repository at 'repo' use the object store
+    # 'objects' as an alternate, if it doesn't already.
+
+    alternates = _alternates_file(repo)
+    objects = os.path.abspath(objects)
+    if objects in _alternates(repo):
+        return
+    os.makedirs(dirname(alternates), exist_ok=True)
+    with open(alternates, 'a') as f:
+        f.write(objects + '\n')
+
+def _remove_alternates(repo, objects):
+    # Make the git repository at 'repo' stop using any of the object
+    # stores in the list 'objects' as alternates. The caller must
+    # make sure it doesn't need any objects from them.
+
+    objects = [os.path.abspath(o) for o in objects]
+    keep = [o for o in _alternates(repo) if o not in objects]
+    with open(_alternates_file(repo), 'w') as f:
+        f.writelines(o + '\n' for o in keep)
+
 def _rev_type(project, rev=None):
     # Returns a "refined" revision type of rev (default:
     # project.revision) as one of the following strings: 'tag', 'tree',
@@ -1198,6 +1921,10 @@ def _fetch(project, rev=None):
     # branch or a tag) available on project.url is part of what got
     # fetched.
     #
+    # Which tags get fetched along the way depends on _tags_policy().
+    # If that's 'none' or 'needed', SHAs which are only reachable
+    # from a tag can't be found by fetching all branches.
+    #
     # Returns a git revision which hopefully can be peeled to the
     # newly-fetched SHA corresponding to rev. "Hopefully" because
     # there are many ways to spell a revision, and they haven't all
@@ -1218,10 +1945,27 @@ def _fetch(project, rev=None):
         depth = ['--depth', str(project.clone_depth)]
     else:
         depth = []
+
+    # --tags is required to get all the tags, since the remote is
+    # specified as a URL. Leaving it out also lets git ask the remote
+    # to advertise only the refs matching our refspec, which matters
+    # for repositories with thousands of tags.
+    tags_policy = _tags_policy(project)
+    tags = ['--tags'] if tags_policy == 'all' else ['--no-tags']
+
     if _maybe_sha(rev):
-        # We can't in general fetch a SHA from a remote, as many hosts
-        # (GitHub included) forbid it for security reasons. Let's hope
-        # it's reachable from some branch.
+        # Many hosts allow fetching a SHA directly
+        # (uploadpack.allowReachableSHA1InWant and friends), which
+        # avoids dragging in every branch head. Try that first, unless
+        # we've already learned that this host forbids it.
+        tried_sha = _fetch_sha(project, rev, depth, tags)
+        if tried_sha:
+            _update_manifest_rev(project, project.revision)
+            return
+
+        # We can't in general fetch a SHA from a remote, as some hosts
+        # forbid it for security reasons. Let's hope it's reachable
+        # from some branch.
         refspec = f'refs/heads/*:{QUAL_REFS}*'
         next_manifest_rev = project.revision
     else:
@@ -1233,31 +1977,339 @@ def _fetch(project, rev=None):
         # from a refspec.
         refspec = project.revision
         next_manifest_rev = 'FETCH_HEAD^{commit}'
+        tried_sha = None
 
     # -f is needed to avoid errors in case multiple remotes are present,
     # at least one of which contains refs that can't be fast-forwarded to our
     # local ref space.
-    #
-    # --tags is required to get tags, since the remote is specified as a URL.
     log.small_banner(msg)
-    project.git(['fetch', '-f', '--tags'] + depth +
+    project.git(['fetch', '-f'] + tags + depth +
                 ['--', project.url, refspec])
+    if tags_policy == 'needed' and tried_sha is None:
+        _create_fetched_tag(project)
     _update_manifest_rev(project, next_manifest_rev)
+    if tried_sha is False:
+        # Fetching the SHA directly failed, but it's reachable from a
+        # branch, so it's the host that doesn't allow it. This has to
+        # wait until manifest-rev is updated, which fails if the SHA
+        # doesn't exist at all.
+        _sha_fetch_allowed(project, False)
+
+def _update_jobs(option):
+    # The value of update.<option>, a number of workers for one stage
+    # of the update pipeline, or 1 if it's unset or invalid.
+
+    try:
+        ret = config.getint('update', option, fallback=1)
+    except ValueError:
+        ret = 0
+    if ret < 1:
+        log.wrn(f'ignoring invalid config update.{option}='
+                f"{config.get('update', option)}; must be a positive integer")
+        ret = 1
+    return ret
+
+def _import_fetch_mode():
+    # How should update_importer() get manifest data from projects
+    # which aren't cloned yet? 'full' updates them right away;
+    # 'filter' uses _filtered_import_fetch().
+
+    cfg = config.get('update', 'import-fetch', fallback=None)
+    if cfg is not None and cfg not in ('full', 'filter'):
+        log.wrn(f'ignoring invalid config update.import-fetch={cfg}; '
+                'choices: full, filter')
+        cfg = None
+    return cfg or 'full'
+
+def _filtered_import_fetch(project):
+    # Fetch project.revision into a scratch repository in WEST_DIR,
+    # without history or file contents, at QUAL_IMPORT_REF. This is
+    # a partial clone, so the blobs for any manifest files read from
+    # it are fetched on demand.
+    #
+    # Returns a Project for the scratch repository, or None if the
+    # fetch failed (e.g. because the remote doesn't support filters
+    # or fetching this revision by SHA), in which case the caller
+    # should update the project as usual.
+
+    scratch = join(project.topdir, WEST_DIR, IMPORTS_DIR,
+                   quote(project.name, safe=''))
+    shutil.rmtree(scratch, ignore_errors=True)
+    os.makedirs(scratch)
+    ret = Project(project.name, project.url, revision=project.revision,
+                  path=relpath(scratch, project.topdir),
+                  topdir=project.topdir)
+
+    log.small_banner(f'{project.name}: fetching manifest data from '
+                     f'{project.url}')
+    try:
+        ret.git('init --bare -q')
+        for option, value in [('core.repositoryformatversion', '1'),
+                              ('extensions.partialClone', 'origin'),
+                              ('remote.origin.url', project.url),
+                              ('remote.origin.promisor', 'true'),
+                              ('remote.origin.partialclonefilter',
+                               'blob:none')]:
+            ret.git(['config', option, value])
+        ret.git(['fetch', '-q', '--no-tags', '--depth=1',
+                 '--filter=blob:none', 'origin',
+                 f'+{project.revision}:{QUAL_IMPORT_REF}'],
+                capture_stderr=True)
+    except subprocess.CalledProcessError as e:
+        log.dbg(f'{project.name}: filtered fetch failed ({e}); '
+                'updating it instead', level=log.VERBOSE_VERY)
+        shutil.rmtree(scratch, ignore_errors=True)
+        return None
+    return ret
+
+def _tags_policy(project):
+    # _fetch() helper. Returns which tags to fetch for the project:
+    # 'all', 'none', or 'needed' (just the revision, if it's a tag).
+    # The project's fetch-tags in the manifest overrides update.tags.
+
+    if project.fetch_tags:
+        return project.fetch_tags
+
+    cfg = config.get('update', 'tags', fallback=None)
+    if cfg is not None and cfg not in ('all', 'none', 'needed'):
+        log.wrn(f'ignoring invalid config update.tags={cfg}; '
+                'choices: all, none, needed')
+        cfg = None
+    return cfg or 'all'
+
+def _create_fetched_tag(project):
+    # _fetch() helper for the 'needed' tags policy. If what we just
+    # fetched with --no-tags was a tag, create it locally, so the
+    # revision can be found without fetching next time.
+    #
+    # FETCH_HEAD lines look like this:
+    #
+    # <sha> TAB [not-for-merge] TAB tag 'v1.0' of <url>
+
+    fetch_head = project.git('rev-parse --git-path FETCH_HEAD',
+                             capture_stdout=True).stdout.decode().strip()
+    with open(os.path.join(project.abspath, fetch_head), 'r') as f:
+        line = f.readline()
+    match = re.match(r"([0-9a-f]+)\t[^\t]*\ttag '(.+)' of ", line)
+    if not match:
+        return
+    sha, tag = match.groups()
+    project.git(['update-ref', f'refs/tags/{tag}', sha])
+
+def _fetch_sha(project, sha, depth, tags):
+    # _fetch() helper. Try to fetch a full SHA directly from
+    # project.url. Returns True on success, False if the host refused
+    # to send it, and None if we didn't try or it failed for another
+    # reason, like a network error.
+    #
+    # Whether the remote host supports this is remembered in
+    # SHA_FETCH_CACHE, keyed by host, so we don't keep trying
+    # (and failing) to do it.
+
+    if len(sha) != 40:
+        # Abbreviated SHAs can't be used as the <src> in a refspec.
+        return None
+
+    host = _url_host(project.url)
+    allowed = read_state(project.topdir, SHA_FETCH_CACHE).get(host)
+    if allowed is False:
+        log.dbg(f'{project.name}: {host} does not allow fetching SHAs',
+                level=log.VERBOSE_VERY)
+        return None
 
-def _head_ok(project):
-    # Returns True if the reference 'HEAD' exists and is not a tag or remote
-    # ref (e.g. refs/remotes/origin/HEAD).
-    # Some versions of git will report 1, when doing
-    # 'git show-ref --verify HEAD' even if HEAD is valid, see #119.
-    # 'git show-ref --head <reference>' will always return 0 if HEAD or
-    # <reference> is valid.
-    # We are only interested in HEAD, thus we must avoid <reference> being
-    # valid. '/' can never point to valid reference, thus 'show-ref --head /'
-    # will return:
-    # - 0 if HEAD is present
-    # - 1 otherwise
-    return project.git('show-ref --quiet --head /',
-                       check=False).returncode == 0
+    log.small_banner(f'{project.name}: fetching SHA {sha}' +
+                     (f' with --depth {depth[1]}' if depth else ''))
+    cp = project.git(['fetch', '-f'] + tags + depth +
+                     ['--', project.url, sha],
+                     check=False, capture_stderr=True)
+    if cp.returncode:
+        log.dbg(f'{project.name}: fetching {sha} directly failed; '
+                'falling back on fetching all branches')
+        if _SHA_FETCH_REFUSED.search(cp.stderr.decode('utf-8', 'replace')):
+            # The host may not allow this, or the SHA may just not
+            # exist. _fetch() will find out which by falling back on
+            # fetching all branches, then call _sha_fetch_allowed() if
+            # the SHA turns up.
+            return False
+        # Anything else may be temporary, so don't remember it.
+        return None
+
+    if not allowed:
+        _sha_fetch_allowed(project, True)
+    return True
+
+def _sha_fetch_allowed(project, allowed):
+    # Remember whether the host serving project.url allows fetching
+    # SHAs directly.
+
+    _update_west_state(project.topdir, SHA_FETCH_CACHE,
+                       {_url_host(project.url): allowed})
+
+def _url_host(url):
+    # Get a key for the host serving a git URL. This handles
+    # scheme://[user@]host[:port]/path, scp-like [user@]host:path,
+    # and local paths, which are all lumped together.
+
+    parsed = urlparse(url)
+    if parsed.scheme and parsed.netloc:
+        return parsed.netloc.rpartition('@')[2]
+    elif parsed.scheme == 'file' or '://' in url:
+        return 'local'
+
+    # An scp-like URL has a colon before any slash. Be careful not to
+    # confuse Windows drive letters ('C:\\...') with hostnames.
+    colon, slash = url.find(':'), url.find('/')
+    if colon > 1 and (slash == -1 or colon < slash):
+        return url[:colon].rpartition('@')[2]
+    return 'local'
+
+def _update_west_state(topdir, name, values):
+    # Update the JSON file topdir/.west/<name> with the dict 'values'.
+    # This is safe to call from multiple threads.
+
+    with _WEST_STATE_LOCK:
+        state = read_state(topdir, name)
+        state.update(values)
+        write_state(topdir, name, state)
+
+def _bundle_path(bundle, project, suffix):
+    # Path to a file for project inside a 'west bundle create'
+    # directory. Project names may contain slashes or other special
+    # characters, so quote them.
+    return join(bundle, BUNDLE_PROJECTS_DIR,
+                quote(project.name, safe='') + suffix)
+
+def _bundle_project(bundle, project):
+    # Write the history reachable from project's manifest-rev into a
+    # bundle. Returns True on success, False on error.
+    #
+    # Bundles from shallow repositories can't be fetched from
+    # without the shallow boundary, so save that too.
+
+    log.small_banner(f'{project.name}: bundling {MANIFEST_REV}')
+    try:
+        project.git(['bundle', 'create',
+                     _bundle_path(bundle, project, '.bundle'),
+                     QUAL_MANIFEST_REV])
+        shallow = join(project.abspath, _git_path(project, 'shallow'))
+        if exists(shallow):
+            shutil.copyfile(shallow,
+                            _bundle_path(bundle, project, '.shallow'))
+    except subprocess.CalledProcessError:
+        return False
+    return True
+
+def _unbundle_project(bundle, topdir, project):
+    # Create project from the files _bundle_project() made, and check
+    # out its frozen revision. Returns True on success, False on error.
+
+    log.small_banner(f'{project.name}: creating from bundle')
+    try:
+        project.git(['init', project.abspath], cwd=topdir)
+        project.git(['remote', 'add', '--', project.remote_name,
+                     project.url])
+        shallow = _bundle_path(bundle, project, '.shallow')
+        if exists(shallow):
+            shutil.copyfile(shallow,
+                            join(project.abspath,
+                                 _git_path(project, 'shallow')))
+        project.git(['fetch', '--', _bundle_path(bundle, project, '.bundle'),
+                     QUAL_MANIFEST_REV])
+        _update_manifest_rev(project, project.revision)
+        project.git(['checkout', '--detach', project.revision])
+    except subprocess.CalledProcessError:
+        return False
+    return True
+
+def _git_path(project, path):
+    # Path to 'path' inside project's .git directory, relative to
+    # the project's top level directory unless it's elsewhere.
+    return project.git(['rev-parse', '--git-path', path],
+                       capture_stdout=True).stdout.decode('utf-8').strip()
+
+def _location_entry(project):
+    # Make a PROJECT_LOCATIONS entry for a project.
+
+    return {'path': PurePath(project.path).as_posix(), 'url': project.url}
+
+def _move_old_clone(project, claimed):
+    # If project was cloned somewhere else last time, according to
+    # PROJECT_LOCATIONS, and that path isn't used by a project in the
+    # manifest anymore, move the old clone to project.abspath instead
+    # of cloning it again. Returns True if the clone was moved.
+
+    old = read_state(project.topdir, PROJECT_LOCATIONS).get(
+        project.name)
+    if not isinstance(old, dict) or old.get('url') != project.url:
+        return False
+    old_path = old.get('path')
+    if not isinstance(old_path, str):
+        return False
+    old_project = Project(project.name, project.url, path=old_path,
+                          topdir=project.topdir)
+    if (old_project.abspath == project.abspath or
+            old_project.abspath in claimed or
+            not old_project.is_cloned()):
+        return False
+    if exists(project.abspath) and os.listdir(project.abspath):
+        return False
+
+    log.small_banner(f'{project.name}: moving clone from {old_path} '
+                     f'to {project.path}')
+    try:
+        if exists(project.abspath):
+            os.rmdir(project.abspath)
+        os.makedirs(dirname(project.abspath), exist_ok=True)
+        os.rename(old_project.abspath, project.abspath)
+    except OSError as e:
+        log.wrn(f'{project.name}: could not move {old_project.abspath} '
+                f'to {project.abspath} ({e}); cloning it again instead')
+        return False
+    return True
+
+def _history_entry(project, seconds):
+    # Make an UPDATE_HISTORY entry for a project which took 'seconds'
+    # to update or fetch. Its size on disk is saved as well, in KiB.
+
+    cp = project.git('count-objects -v', check=False,
+                     capture_stdout=True, capture_stderr=True)
+    size = 0
+    for line in cp.stdout.decode('utf-8').splitlines():
+        key, _, value = line.partition(': ')
+        if key in ('size', 'size-pack') and value.isdigit():
+            size += int(value)
+    return {'seconds': round(seconds, 3), 'size': size}
+
+def _lpt_order(projects, history):
+    # Return a copy of 'projects' sorted so the ones we expect to
+    # take longest to update come first, based on 'history', the
+    # contents of UPDATE_HISTORY. This is "longest processing time
+    # first" scheduling.
+    #
+    # Projects with no history are assumed to be as slow as the
+    # slowest known project, unless they have a clone depth, in which
+    # case they're assumed to be average.
+
+    def seconds(name):
+        try:
+            return float(history[name]['seconds'])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    known = [t for t in map(seconds, history) if t is not None]
+    if not known:
+        return list(projects)
+    slowest = max(known)
+    average = sum(known) / len(known)
+
+    def estimate(project):
+        ret = seconds(project.name)
+        if ret is not None:
+            return ret
+        return average if project.clone_depth else slowest
+
+    # sorted() is stable, so ties stay in manifest order.
+    return sorted(projects, key=estimate, reverse=True)
 
 def _post_checkout_help(project, branch, sha, is_ancestor):
     # Print helpful information to the user about a project that
@@ -1313,6 +2365,14 @@ def die_unknown(unknown):
     log.die(f'unknown project name{s}/path{s}: {names}\n'
             '  Hint: use "west list" to list all projects.')
 
+def die_uncloned(uncloned):
+    # Scream and die about uncloned projects.
+
+    s = 's' if len(uncloned) > 1 else ''
+    names = ' '.join(p.name for p in uncloned)
+    log.die(f'uncloned project{s}: {names}.\n'
+            '  Hint: run "west update" and retry.')
+
 @lru_cache(maxsize=1)
 def warn_once_if_no_git():
     # Using an LRU cache means this gets called once. Afterwards, the
@@ -1339,6 +2399,42 @@ def die_if_no_git():
 # Top-level west directory, containing west itself and the manifest.
 WEST_DIR = '.west'
 
+# File in WEST_DIR which records which hosts allow fetching SHAs.
+SHA_FETCH_CACHE = 'sha-fetch.json'
+
+# What git says when a host won't send an object we asked for by SHA.
+_SHA_FETCH_REFUSED = re.compile(
+    'not our ref|does not allow request for unadvertised object')
+
+# Serializes updates to the above files from concurrent threads.
+_WEST_STATE_LOCK = threading.Lock()
+
+# File in WEST_DIR which records how long each project took to update
+# or fetch last time, and how big it is.
+UPDATE_HISTORY = 'update-history.json'
+
+# File in WEST_DIR which records each project's path and URL as of the
+# last time it was updated or fetched.
+PROJECT_LOCATIONS = 'project-locations.json'
+
+# Directory in WEST_DIR with scratch repositories used by
+# _filtered_import_fetch(), and the ref it fetches into.
+IMPORTS_DIR = 'imports'
+QUAL_IMPORT_REF = 'refs/west/import'
+
+# Directory in WEST_DIR with an object pool (a bare repository) for
+# each family of projects with the same root commit, and a file in
+# WEST_DIR which caches each project URL's root commit.
+POOLS_DIR = 'pools'
+POOL_ROOTS = 'pool-roots.json'
+
+# Files in a directory created by 'west bundle create': the frozen
+# manifest, a bundle of the manifest repository, and a subdirectory
+# with a bundle (and maybe a shallow file) for each project.
+BUNDLE_MANIFEST = 'west.yml'
+BUNDLE_MANIFEST_REPO = 'manifest.bundle'
+BUNDLE_PROJECTS_DIR = 'projects'
+
 # Default manifest repository URL.
 MANIFEST_URL_DEFAULT = 'https://github.com/zephyrproject-rtos/zephyr'
 # Default revision to check out of the manifest repository.
@@ -0,0 +1,38 @@
+# Copyright (c) 2020, Nordic Semiconductor ASA
+#
+# SPDX-License-Identifier: Apache-2.0
+
+'''West topdir command.
+
+This is kept apart from the other project commands, since shell
+prompts and scripts may run it all the time, and it shouldn't have to
+import them.
+'''
+
+import argparse
+from pathlib import PurePath
+import textwrap
+
+from west import log
+from west.commands import WestCommand
+
+class Topdir(WestCommand):
+    def __init__(self):
+        super().__init__(
+            'topdir',
+            'print the top level directory of the workspace',
+            textwrap.dedent('''\
+            Prints the absolute path of the current west workspace's
+            top directory.
+
+            This is the directory containing .west. All project
+            paths in the manifest are relative to this top directory.'''),
+            requires_manifest=False)
+
+    def do_add_parser(self, parser_adder):
+        return parser_adder.add_parser(
+            self.name, help=self.help, description=self.description,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    def do_run(self, args, user_args):
+        log.inf(PurePath(self.topdir).as_posix())
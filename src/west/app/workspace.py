@@ -0,0 +1,87 @@
+# Copyright (c) 2020, Nordic Semiconductor ASA
+#
+# SPDX-License-Identifier: Apache-2.0
+
+'''Cached information about the workspace a west command runs in.'''
+
+import os
+
+from west import configuration as config
+from west.manifest import Manifest, _WEST_YML, _config_groups, _mpath
+
+class Workspace:
+    # Information about a west workspace which many parts of a single
+    # west invocation need: its top level directory, its merged
+    # configuration, the manifest.path and update.groups options, and
+    # the parsed manifest.
+    #
+    # Each of these is computed the first time it's needed, then
+    # cached, so a command doesn't walk the file system, re-read
+    # configuration files, or re-parse the manifest to get them again.
+    # Everything but topdir is thrown away when west itself writes a
+    # configuration file, since it may have changed.
+
+    def __init__(self, topdir):
+        # The caller must already have read the configuration files
+        # for this workspace into west.configuration.config.
+
+        self.topdir = topdir
+        self._generation = config._write_generation
+        self._cache = {'config': config.config}
+
+    @property
+    def config(self):
+        # The merged configuration, west.configuration.config.
+        cache = self._cached()
+        if 'config' not in cache:
+            config._reread_config(topdir=self.topdir)
+            cache['config'] = config.config
+        return cache['config']
+
+    @property
+    def manifest_path(self):
+        # The manifest.path option, from the local configuration file.
+        # Raises MalformedConfig if it isn't set.
+        cache = self._cached()
+        if 'manifest_path' not in cache:
+            cache['manifest_path'] = _mpath(topdir=self.topdir)
+        return cache['manifest_path']
+
+    @property
+    def group_filter(self):
+        # The parsed update.groups option, as a new list the caller
+        # may modify. Raises MalformedConfig if it's invalid.
+        cache = self._cached()
+        if 'group_filter' not in cache:
+            cache['group_filter'] = _config_groups(self.topdir,
+                                                   cp=self.config)
+        return list(cache['group_filter'])
+
+    @property
+    def manifest(self):
+        # The workspace's manifest, parsed with default arguments.
+        # Exceptions raised while parsing it are not cached.
+        cache = self._cached()
+        if 'manifest' not in cache:
+            cache['manifest'] = self.load_manifest()
+        return cache['manifest']
+
+    def load_manifest(self, **kwargs):
+        # Parse the manifest from scratch, like
+        # Manifest.from_file(topdir=self.topdir, **kwargs), but using
+        # the cached manifest.path and update.groups values.
+
+        mpath = self.manifest_path
+        kwargs.setdefault('group_filter', self.group_filter)
+        return Manifest(source_file=os.path.join(self.topdir, mpath,
+                                                 _WEST_YML),
+                        manifest_path=mpath, topdir=self.topdir, **kwargs)
+
+    def _cached(self):
+        # Return the cache, after emptying it if a configuration file
+        # has been written since it was filled.
+
+        if self._generation != config._write_generation:
+            self._generation = config._write_generation
+            self._cache = {}
+        return self._cache
@@ -12,10 +12,8 @@ import sys
 from types import ModuleType
 from typing import Dict
 
-import pykwalify
-import yaml
-
 from west import log
+from west._state import read_state, write_state
 from west.configuration import config as _config
 from west.manifest import Manifest
 from west.util import escapes_directory
@@ -37,6 +35,10 @@ _EXT_MODULES_CACHE: Dict[str, ModuleType] = {}
 # Infinite iterator of "fresh" extension command module names.
 _EXT_MODULES_NAME_IT = (f'west.commands.ext.cmd_{i}'
                         for i in itertools.count(1))
+# File in the workspace's .west directory which caches the validated
+# contents of west-commands files, so they don't have to be parsed
+# again until they change.
+_EXT_SPEC_CACHE = 'extension-commands.json'
 
 class CommandError(RuntimeError):
     '''Indicates that a command failed.'''
@@ -70,7 +72,8 @@ class WestCommand(ABC):
     '''Abstract superclass for a west command.'''
 
     def __init__(self, name, help, description, accepts_unknown_args=False,
-                 requires_workspace=True, requires_installation=None):
+                 requires_workspace=True, requires_installation=None,
+                 requires_manifest=True):
         '''Abstract superclass for a west command.
 
         Some fields, such as *name*, *help*, and *description*,
@@ -91,6 +94,10 @@ class WestCommand(ABC):
             a fatal error.
         :param requires_installation: deprecated equivalent for
             "requires_workspace"; this may go away eventually.
+        :param requires_manifest: if false, west does not load the
+            manifest before running the command, which makes it start
+            faster. The command's ``manifest`` attribute is then not
+            available.
         '''
         self.name = name
         self.help = help
@@ -101,10 +108,12 @@ class WestCommand(ABC):
         else:
             self.requires_workspace = requires_workspace
         self.requires_installation = self.requires_workspace
+        self.requires_manifest = requires_manifest
         self.topdir = None
         self.manifest = None
+        self._workspace = None
 
-    def run(self, args, unknown, topdir, manifest=None):
+    def run(self, args, unknown, topdir, manifest=None, workspace=None):
         '''Run the command.
 
         This raises `west.commands.CommandContextError` if the command
@@ -118,6 +127,8 @@ class WestCommand(ABC):
             ``self.topdir`` from `WestCommand.do_run`
         :param manifest: `west.manifest.Manifest` or ``None``,
             accessible as ``self.manifest`` from `WestCommand.do_run`
+        :param workspace: cached information about the workspace,
+            for west's internal use
         '''
         if unknown and not self.accepts_unknown_args:
             self.parser.error(f'unexpected arguments: {unknown}')
@@ -125,6 +136,7 @@ class WestCommand(ABC):
             log.die(_no_topdir_msg(os.getcwd(), self.name))
         self.topdir = topdir
         self.manifest = manifest
+        self._workspace = workspace
         self.do_run(args, unknown)
 
     def add_parser(self, parser_adder):
@@ -256,15 +268,25 @@ def extension_commands(manifest=None):
     if manifest is None:
         manifest = Manifest.from_file()
 
+    topdir = manifest.topdir
+    cache = read_state(topdir, _EXT_SPEC_CACHE) if topdir else {}
+    new_cache = {}
     specs = OrderedDict()
     for project in manifest.projects:
         if project.west_commands:
-            specs[project.path] = _ext_specs(project)
+            specs[project.path] = _ext_specs(project, cache, new_cache)
+    if topdir and new_cache != cache:
+        write_state(topdir, _EXT_SPEC_CACHE, new_cache)
     return specs
 
-def _ext_specs(project):
+def _ext_specs(project, cache=None, new_cache=None):
     # Get a list of WestExtCommandSpec objects for the given
     # west.manifest.Project.
+    #
+    # If 'cache' is given, it maps west-commands file paths to cache
+    # entries from _ext_spec_cache_entry(), and is used instead of
+    # parsing any files which haven't changed. Entries for the files
+    # read are stored in 'new_cache', if given.
 
     ret = []
 
@@ -290,26 +312,58 @@ def _ext_specs(project):
         # The project may not be cloned yet, or this might be coming
         # from a manifest that was copy/pasted into a self import
         # location.
-        if not os.path.exists(spec_file):
+        try:
+            st = os.stat(spec_file)
+        except OSError:
             continue
 
-        # Load the spec file and check the schema.
-        with open(spec_file, 'r') as f:
+        # Use the cached contents if the file hasn't changed since
+        # they were saved. Otherwise, load the spec file and check the
+        # schema. These modules are slow to import, so only do it if
+        # we have to.
+        entry = (cache or {}).get(spec_file)
+        if not _ext_spec_cache_hit(entry, st):
+            import pykwalify.core
+            import yaml
+
+            with open(spec_file, 'r') as f:
+                try:
+                    commands_spec = yaml.safe_load(f.read())
+                except yaml.YAMLError as e:
+                    raise ExtensionCommandError from e
             try:
-                commands_spec = yaml.safe_load(f.read())
-            except yaml.YAMLError as e:
+                pykwalify.core.Core(
+                    source_data=commands_spec,
+                    schema_files=[_EXT_SCHEMA_PATH]).validate()
+            except pykwalify.errors.SchemaError as e:
                 raise ExtensionCommandError from e
-        try:
-            pykwalify.core.Core(
-                source_data=commands_spec,
-                schema_files=[_EXT_SCHEMA_PATH]).validate()
-        except pykwalify.errors.SchemaError as e:
-            raise ExtensionCommandError from e
 
-        for commands_desc in commands_spec['west-commands']:
+            entry = _ext_spec_cache_entry(st, commands_spec['west-commands'])
+
+        if new_cache is not None:
+            new_cache[spec_file] = entry
+
+        for commands_desc in entry['west-commands']:
             ret.extend(_ext_specs_from_desc(project, commands_desc))
     return ret
 
+def _ext_spec_cache_entry(st, west_commands):
+    # An extension spec cache entry for a west-commands file with
+    # os.stat() result 'st', whose validated 'west-commands' value is
+    # 'west_commands'.
+
+    return {'mtime_ns': st.st_mtime_ns, 'size': st.st_size,
+            'west-commands': west_commands}
+
+def _ext_spec_cache_hit(entry, st):
+    # True if 'entry' is a valid cache entry for a west-commands file
+    # which still has os.stat() result 'st'.
+
+    return (isinstance(entry, dict) and
+            entry.get('mtime_ns') == st.st_mtime_ns and
+            entry.get('size') == st.st_size and
+            isinstance(entry.get('west-commands'), list))
+
 def _ext_specs_from_desc(project, commands_desc):
     py_file = os.path.join(project.abspath, commands_desc['file'])
 
@@ -41,8 +41,6 @@ import pathlib
 import platform
 from enum import Enum
 
-import configobj
-
 from west.util import west_dir, WestNotFound, canon_path
 
 def _configparser():            # for internal use
@@ -56,6 +54,11 @@ def _configparser():            # for internal use
 # tests).
 config = _configparser()
 
+# Number of times west has written a configuration file, so values
+# which were computed from the configuration files can tell when
+# they're out of date.
+_write_generation = 0
+
 class ConfigFile(Enum):
     '''Types of west configuration file.
 
@@ -130,12 +133,15 @@ def update_config(section, key, value, configfile=ConfigFile.LOCAL,
         # Not possible to update ConfigFile.ALL, needs specific conf file here.
         raise ValueError(f'invalid configfile: {configfile}')
 
+    import configobj  # only needed to write, so import it here
+
     filename = _ensure_config(configfile, topdir)
     updater = configobj.ConfigObj(filename)
     if section not in updater:
         updater[section] = {}
     updater[section][key] = value
     updater.write()
+    _config_written()
 
 def delete_config(section, key, configfile=None, topdir=None):
     '''Delete the option section.key from the given file or files.
@@ -178,6 +184,8 @@ def delete_config(section, key, configfile=None, topdir=None):
     else:
         to_check = [_location(x, topdir=topdir) for x in configfile]
 
+    import configobj  # see update_config()
+
     found = False
     for path in to_check:
         cobj = configobj.ConfigObj(path)
@@ -194,6 +202,20 @@ def delete_config(section, key, configfile=None, topdir=None):
 
     if not found:
         raise KeyError(f'{section}.{key}')
+    _config_written()
+
+def _config_written():
+    global _write_generation
+    _write_generation += 1
+
+def _reread_config(topdir=None):
+    # Empty the global config object and read the configuration files
+    # into it again. This is for code that runs more than one command
+    # in the same process, since a command may have changed them.
+
+    for section in config.sections():
+        config.remove_section(section)
+    read_config(topdir=topdir)
 
 def _location(cfg, topdir=None):
     # Making this a function that gets called each time you ask for a
@@ -146,7 +146,7 @@ def die(*args, exit_code=1) -> NoReturn:
     err(*args, fatal=True)
     sys.exit(exit_code)
 
-def msg(*args, color=None, stream=sys.stdout):
+def msg(*args, color=None, stream=None):
     '''Print a message using a color.
 
     :param args: sequence of arguments to print.
@@ -158,6 +158,8 @@ def msg(*args, color=None, stream=sys.stdout):
     '''
     if color is None:
         raise ValueError('no color was given')
+    if stream is None:
+        stream = sys.stdout
 
     if _use_colors():
         print(color, end='', file=stream)
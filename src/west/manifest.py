@@ -14,13 +14,16 @@ import errno
 import logging
 import os
 from pathlib import PurePath, PurePosixPath, Path
+import re
 import shlex
 import subprocess
+from time import perf_counter
 
-from packaging.version import parse as parse_version
-import pykwalify.core
-import yaml
+# yaml, pykwalify.core and packaging.version are imported when they're
+# first needed. They take a good part of west's startup time, and
+# commands like 'west topdir' never use them.
 
+from west import trace
 from west import util
 import west.configuration as cfg
 
@@ -41,7 +44,7 @@ QUAL_REFS_WEST = 'refs/west/'
 #:
 #: This value changes when a new version of west includes new manifest
 #: file features not supported by earlier versions of west.
-SCHEMA_VERSION = '0.7'
+SCHEMA_VERSION = '0.8'
 # MAINTAINERS:
 #
 # If you want to update the schema version, you need to make sure that
@@ -108,15 +111,18 @@ def validate(data):
         # by explicitly allowing:
         #
         #  version: 1.0
+        from packaging.version import parse as parse_version
+
         min_version_str = str(data['version'])
         min_version = parse_version(min_version_str)
-        if min_version > _SCHEMA_VER:
+        if min_version > parse_version(SCHEMA_VERSION):
             raise ManifestVersionError(min_version)
-        elif min_version < _EARLIEST_VER:
+        elif min_version < parse_version(_EARLIEST_VER_STR):
             raise MalformedManifest(
                 f'invalid version {min_version}; '
                 f'lowest schema version is {_EARLIEST_VER_STR}')
 
+    import pykwalify.core
     try:
         pykwalify.core.Core(source_data=data,
                             schema_files=[_SCHEMA_PATH]).validate()
@@ -186,6 +192,10 @@ class Manifest:
             - If only *topdir* is given, that workspace's
               ``manifest.path`` is used to find *source_file*.
 
+        Unless *group_filter* is in *kwargs*, the ``update.groups``
+        configuration option is also used whenever the workspace's
+        configuration files are read to find *source_file*.
+
         Exceptions raised:
 
             - `west.util.WestNotFound` if no *topdir* can be found
@@ -197,7 +207,7 @@ class Manifest:
               old to parse the manifest.
 
             - `MalformedConfig` if ``manifest.path`` is needed and
-              can't be read
+              can't be read, or ``update.groups`` is invalid
 
             - ``ValueError`` if *topdir* is given but is not a west
               workspace root
@@ -217,6 +227,7 @@ class Manifest:
                     'source_file': os.path.join(topdir, _mpath(topdir=topdir),
                                                 _WEST_YML)
                 })
+                kwargs.setdefault('group_filter', _config_groups(topdir))
             else:
                 # Just source_file: find topdir starting there.
                 # We need source_file in kwargs as that's what gets used below.
@@ -245,6 +256,7 @@ class Manifest:
                 'source_file': source_file,
                 'manifest_path': mpath,
             })
+            kwargs.setdefault('group_filter', _config_groups(topdir))
         else:
             # Both source_file and topdir.
             kwargs['source_file'] = source_file
@@ -281,7 +293,7 @@ class Manifest:
 
     def __init__(self, source_file=None, source_data=None,
                  manifest_path=None, topdir=None, importer=None,
-                 import_flags=0, **kwargs):
+                 import_flags=0, group_filter=None, **kwargs):
         '''
         Using `from_file` or `from_data` is usually easier than direct
         instantiation.
@@ -299,6 +311,9 @@ class Manifest:
               an "import:" attribute in "self:" or "projects:"; False
               otherwise
 
+            - ``group_filter``: list of group filter elements used to
+              decide which projects are active (see below)
+
         Exactly one of *source_file* and *source_data* must be given.
 
         If *source_file* is given:
@@ -333,6 +348,15 @@ class Manifest:
         YAML files. A return value of None will cause the import to be
         ignored.
 
+        The *group_filter* kwarg, if given, is a list of strings like
+        ``"+foo"`` or ``"-bar"`` which enable or disable project
+        groups; a group name without a prefix is enabled. Later
+        elements override earlier ones, and groups are enabled unless
+        disabled. Projects with a ``groups:`` attribute are inactive
+        if all of their groups are disabled. Inactive projects, and
+        anything they import, are left out of ``projects``. Projects
+        imported from a project inherit its groups.
+
         Exceptions raised:
 
             - `MalformedManifest`: if the manifest data is invalid
@@ -357,6 +381,7 @@ class Manifest:
         :param importer: callback to resolve missing manifest import
             data
         :param import_flags: bit mask, controls import resolution
+        :param group_filter: enabled and disabled project groups
         '''
         if source_file and source_data:
             raise ValueError('both source_file and source_data were given')
@@ -406,12 +431,19 @@ class Manifest:
 
         self.has_imports = False
 
+        self.group_filter = list(group_filter or [])
+
         # Set up the public attributes documented above, as well as
         # any internal attributes needed to implement the public API.
         self._importer = importer or _default_importer
         self._import_flags = import_flags
-        self._load(source_data['manifest'], manifest_path,
-                   kwargs.get('import-context', _import_ctx({}, None)))
+        self._enabled_groups = _enabled_groups(self.group_filter)
+        ctx = kwargs.get('import-context',
+                         _import_ctx({}, None, None, set(), {}, []))
+        if self.path:
+            ctx.files.append(self.path)
+        with trace.span('load manifest', cat='manifest', path=self.path):
+            self._load(source_data['manifest'], manifest_path, ctx)
 
     def get_projects(self, project_ids, allow_paths=True, only_cloned=False):
         '''Get a list of `Project` objects in the manifest from
@@ -476,6 +508,18 @@ class Manifest:
             raise ValueError(unknown, uncloned)
         return ret
 
+    def _import_chain(self, project):
+        # Return the projects whose imports had to be resolved to
+        # find 'project', outermost first. This is empty for
+        # projects defined in the manifest repository.
+
+        ret = []
+        provider = self._providers.get(project.name)
+        while provider is not None:
+            ret.insert(0, provider)
+            provider = self._providers.get(provider.name)
+        return ret
+
     def _as_dict_helper(self, pdict=None):
         # pdict: a function which is given a project, and returns its
         #   dict representation. By default, it's Project.as_dict.
@@ -538,6 +582,7 @@ class Manifest:
 
         :param kwargs: passed to yaml.safe_dump()
         '''
+        import yaml
         return yaml.safe_dump(self.as_dict(), **kwargs)
 
     def as_frozen_yaml(self, **kwargs):
@@ -550,6 +595,7 @@ class Manifest:
 
         :param kwargs: passed to yaml.safe_dump()
         '''
+        import yaml
         return yaml.safe_dump(self.as_frozen_dict(), **kwargs)
 
     def _malformed(self, complaint, parent=None):
@@ -604,6 +650,8 @@ class Manifest:
         # Save the results.
         self.projects = list(ctx.projects.values())
         self.projects.insert(MANIFEST_PROJECT_INDEX, mp)
+        self._providers = ctx.providers
+        self._files = ctx.files
         self._projects_by_name = {'manifest': mp}
         self._projects_by_name.update(ctx.projects)
         self._projects_by_cpath = {}
@@ -711,6 +759,7 @@ class Manifest:
             self._import_pathobj_from_self(mp, p, ctx)
         elif p.is_dir():
             _logger.debug(f'found submanifest directory: {p}')
+            ctx.files.append(str(p))
             for yml in filter(_is_yml, sorted(p.iterdir())):
                 self._import_pathobj_from_self(mp, p / yml, ctx)
         else:
@@ -737,6 +786,7 @@ class Manifest:
                              topdir=self.topdir,
                              importer=self._importer,
                              import_flags=self._import_flags,
+                             group_filter=self.group_filter,
                              **{'import-context':
                                 ctx}).projects[MANIFEST_PROJECT_INDEX]
         except RecursionError as e:
@@ -782,9 +832,26 @@ class Manifest:
                                 (self.path or 'the same manifest'))
             names.add(name)
 
+            # Projects inherit the groups of the project they were
+            # imported from. Inactive projects are dropped here, so
+            # they are never imported from or cloned. Like projects
+            # which were added, the first definition wins.
+            if ctx.provider is not None:
+                for group in ctx.provider.groups:
+                    if group not in project.groups:
+                        project.groups.append(group)
+            if name in ctx.inactive or not self._is_active(project):
+                if name not in ctx.projects:
+                    ctx.inactive.add(name)
+                    _logger.debug(f'project {name} in file {self.path} ' +
+                                  'ignored: all of its groups are disabled')
+                continue
+
             # Add the project to the map if it's new.
             added = self._add_project(project, ctx.projects)
             if added:
+                if ctx.provider is not None:
+                    ctx.providers[name] = ctx.provider
                 # Track project imports unless we are ignoring those.
                 imp = pd.get('import')
                 if imp:
@@ -799,6 +866,13 @@ class Manifest:
         for project, imp in have_imports:
             self._import_from_project(project, imp, ctx)
 
+    def _is_active(self, project):
+        # Is the project active given our group filter?
+
+        return (not project.groups or
+                any(self._enabled_groups.get(group, True)
+                    for group in project.groups))
+
     def _load_project(self, pd, url_bases, defaults):
         # pd = project data (dictionary with values parsed from the
         # manifest)
@@ -840,10 +914,17 @@ class Manifest:
                 f'project {name} '
                 'has no remote or url and no default remote is set')
 
+        groups = pd.get('groups', [])
+        for group in groups:
+            if not _is_group(group):
+                self._malformed(f'project {name}: invalid group "{group}"')
+
         return Project(name, url, pd.get('revision', defaults.revision),
                        pd.get('path', name), clone_depth=pd.get('clone-depth'),
                        west_commands=pd.get('west-commands'),
-                       topdir=self.topdir, remote_name=remote)
+                       fetch_tags=pd.get('fetch-tags'),
+                       topdir=self.topdir, remote_name=remote,
+                       groups=groups)
 
     def _import_from_project(self, project, imp, ctx):
         # Recursively resolve a manifest import from 'project'.
@@ -856,6 +937,7 @@ class Manifest:
 
         self.has_imports = True
 
+        ctx = ctx._replace(provider=project)
         imptype = type(imp)
         if imptype == bool:
             # We should not have been called unless the import was truthy.
@@ -880,43 +962,51 @@ class Manifest:
         # Import data from git at the given path at revision manifest-rev.
         # Fall back on self._importer if that fails.
 
-        _logger.debug(f'resolving import {path} for {project}')
-        imported = self._import_content_from_project(project, path)
-        if imported is None:
-            # This can happen if self._importer returns None.
-            # It means there's nothing to do.
-            return
-
-        for data in imported:
-            if isinstance(data, str):
-                data = _load(data)
-                validate(data)
-            try:
-                # Force a fallback onto manifest_path=project.path.
-                # The subpath to the manifest file itself will not be
-                # available, so that's the best we can do.
-                del data['manifest']['self']['path']
-            except KeyError:
-                pass
-
-            # Destructively add the imported content into our 'projects'
-            # map, passing along our context.
-            try:
-                submp = Manifest(source_data=data,
-                                 manifest_path=project.path,
-                                 topdir=self.topdir,
-                                 importer=self._importer,
-                                 import_flags=self._import_flags,
-                                 **{'import-context': ctx}
-                                 ).projects[MANIFEST_PROJECT_INDEX]
-            except RecursionError as e:
-                raise _ManifestImportDepth(project, path) from e
-
-            # If the submanifest has west commands, merge them
-            # into project's.
-            project.west_commands = self._merge_wcs(
-                project.west_commands, submp.west_commands)
-        _logger.debug(f'done resolving import {path} for {project}')
+        with trace.span(f'import {path} from {project.name}', cat='manifest'):
+            _logger.debug(f'resolving import {path} for {project}')
+            if project.abspath:
+                # The data come from project's manifest-rev branch.
+                git_dir = os.path.join(project.abspath, '.git')
+                ctx.files.extend([
+                    os.path.join(git_dir, QUAL_MANIFEST_REV_BRANCH),
+                    os.path.join(git_dir, 'packed-refs')])
+            imported = self._import_content_from_project(project, path)
+            if imported is None:
+                # This can happen if self._importer returns None.
+                # It means there's nothing to do.
+                return
+
+            for data in imported:
+                if isinstance(data, str):
+                    data = _load(data)
+                    validate(data)
+                try:
+                    # Force a fallback onto manifest_path=project.path.
+                    # The subpath to the manifest file itself will not be
+                    # available, so that's the best we can do.
+                    del data['manifest']['self']['path']
+                except KeyError:
+                    pass
+
+                # Destructively add the imported content into our 'projects'
+                # map, passing along our context.
+                try:
+                    submp = Manifest(source_data=data,
+                                     manifest_path=project.path,
+                                     topdir=self.topdir,
+                                     importer=self._importer,
+                                     import_flags=self._import_flags,
+                                     group_filter=self.group_filter,
+                                     **{'import-context': ctx}
+                                     ).projects[MANIFEST_PROJECT_INDEX]
+                except RecursionError as e:
+                    raise _ManifestImportDepth(project, path) from e
+
+                # If the submanifest has west commands, merge them
+                # into project's.
+                project.west_commands = self._merge_wcs(
+                    project.west_commands, submp.west_commands)
+            _logger.debug(f'done resolving import {path} for {project}')
 
     def _import_content_from_project(self, project, path):
         if not (self._import_flags & ImportFlag.FORCE_PROJECTS) and \
@@ -1071,6 +1161,31 @@ class ManifestVersionError(Exception):
         self.file = file
         '''The file that required this version of west.'''
 
+class ProjectState(collections.namedtuple(
+        'ProjectState',
+        'cloned head branch manifest_rev is_ancestor dirty')):
+    '''The state of a project's repository, as returned by
+    `Project.state`.
+
+    Attributes:
+
+    - ``cloned``: True if the project is cloned. If it's False,
+      all the other attributes are ``None``.
+    - ``head``: SHA of the commit ``HEAD`` points to, or ``None`` if
+      there isn't one (e.g. right after the project was initialized)
+    - ``branch``: name of the checked out branch, or ``None`` if
+      ``HEAD`` is detached
+    - ``manifest_rev``: SHA of ``manifest-rev``, or ``None`` if it
+      doesn't exist
+    - ``is_ancestor``: True if ``manifest-rev`` is an ancestor of
+      (or the same as) ``HEAD``, and False if it isn't, or ``None``
+      if either of them doesn't exist
+    - ``dirty``: True if there are uncommitted changes to tracked files
+
+    ``head``, ``branch``, ``is_ancestor`` and ``dirty`` are also
+    ``None`` if they weren't asked for (see `Project.state`).
+    '''
+
 class Project:
     '''Represents a project defined in a west manifest.
 
@@ -1095,6 +1210,11 @@ class Project:
       the project is part of, or ``None``
     - ``remote_name``: the name of the remote which should be set up
       when the project is being cloned (default: 'origin')
+    - ``fetch_tags``: which tags to fetch when updating the project:
+      ``'all'``, ``'none'``, ``'needed'``, or ``None`` to use the
+      ``update.tags`` configuration option
+    - ``groups``: list of the project's groups, including those
+      inherited from the project it was imported from, if any
     '''
 
     def __eq__(self, other):
@@ -1113,7 +1233,7 @@ class Project:
 
     def __init__(self, name, url, revision=None, path=None,
                  clone_depth=None, west_commands=None, topdir=None,
-                 remote_name=None):
+                 remote_name=None, fetch_tags=None, groups=None):
         '''Project constructor.
 
         If *topdir* is ``None``, then absolute path attributes
@@ -1130,6 +1250,9 @@ class Project:
         :param topdir: the west workspace's top level directory
         :param remote_name: the name of the remote which should be
             set up if the project is being cloned (default: 'origin')
+        :param fetch_tags: tag fetching policy: 'all', 'none',
+            'needed', or None for the configured default
+        :param groups: list of group names the project belongs to
         '''
 
         self.name = name
@@ -1140,6 +1263,8 @@ class Project:
         self.west_commands = west_commands
         self.topdir = topdir
         self.remote_name = remote_name or 'origin'
+        self.fetch_tags = fetch_tags
+        self.groups = list(groups or [])
 
     @property
     def path(self):
@@ -1185,6 +1310,10 @@ class Project:
             ret['clone-depth'] = self.clone_depth
         if self.west_commands:
             ret['west-commands'] = self.west_commands
+        if self.fetch_tags:
+            ret['fetch-tags'] = self.fetch_tags
+        if self.groups:
+            ret['groups'] = self.groups
 
         return ret
 
@@ -1228,12 +1357,17 @@ class Project:
         cmd_str = util.quote_sh_list(args)
 
         _logger.debug(f"running '{cmd_str}' in {cwd}")
+        start = perf_counter()
         popen = subprocess.Popen(
             args, cwd=cwd,
             stdout=subprocess.PIPE if capture_stdout else None,
             stderr=subprocess.PIPE if capture_stderr else None)
 
         stdout, stderr = popen.communicate()
+        trace.record_git_call(args, cwd, start, popen.returncode,
+                              None if stdout is None else len(stdout),
+                              None if stderr is None else len(stderr),
+                              project=self.name)
 
         # We use logger style % formatting here to avoid the
         # potentially expensive overhead of formatting long
@@ -1249,6 +1383,39 @@ class Project:
             return subprocess.CompletedProcess(popen.args, popen.returncode,
                                                stdout, stderr)
 
+    def git_stream(self, cmd, extra_args=(), cwd=None, chunk_size=65536):
+        '''Run a git command in the project repository, streaming
+        its standard output instead of capturing it all in memory.
+
+        Returns an iterable of ``bytes`` chunks of at most
+        *chunk_size* bytes each. After it has been exhausted, its
+        ``returncode`` attribute is git's exit code. Unlike `git`,
+        a non-zero exit code doesn't raise an exception; check
+        ``returncode`` instead. Standard error is not captured.
+
+        If the iteration is abandoned early, call the returned
+        object's ``close()`` method to stop git.
+
+        :param cmd: git command as a string (or list of strings)
+        :param extra_args: sequence of additional arguments to pass to
+            the git command (useful mostly if *cmd* is a string).
+        :param cwd: directory to run git in (default: ``self.abspath``)
+        :param chunk_size: maximum size of each chunk of output
+        '''
+        if isinstance(cmd, str):
+            cmd_list = shlex.split(cmd)
+        else:
+            cmd_list = list(cmd)
+
+        if cwd is None:
+            if self.abspath is not None:
+                cwd = self.abspath
+            else:
+                raise ValueError('no abspath; cwd must be given')
+
+        return _GitStream(['git'] + cmd_list + list(extra_args), cwd,
+                          chunk_size, self.name)
+
     def sha(self, rev, cwd=None):
         '''Get the SHA for a project revision.
 
@@ -1334,6 +1501,71 @@ class Project:
 
         return not (res.returncode or res.stdout.strip())
 
+    def state(self, full=True):
+        '''Get a `ProjectState` for the project's repository.
+
+        This needs just two git commands in the usual case, and a
+        third if ``HEAD`` and ``manifest-rev`` differ, so it's
+        cheaper than asking for each piece of information separately.
+
+        One of them scans the working tree for changes, which takes
+        a while in big repositories. If *full* is false, only the
+        ``cloned`` and ``manifest_rev`` attributes are found, with a
+        single git command which doesn't look at the working tree,
+        and the others are ``None``.
+
+        :param full: if false, only find out if the project is cloned,
+            and where ``manifest-rev`` points
+        '''
+        not_cloned = ProjectState(False, None, None, None, None, None)
+        # A repository's top level directory always contains .git.
+        if not (self.abspath and
+                os.path.exists(os.path.join(self.abspath, '.git'))):
+            return not_cloned
+
+        if not full:
+            _logger.debug(f'{self.name}: getting manifest-rev')
+            cp = self.git(['for-each-ref', '--format=%(objectname)',
+                           QUAL_MANIFEST_REV_BRANCH], check=False,
+                          capture_stdout=True, capture_stderr=True)
+            if cp.returncode:
+                return not_cloned
+            return ProjectState(True, None, None,
+                                cp.stdout.decode('utf-8').strip() or None,
+                                None, None)
+
+        _logger.debug(f'{self.name}: getting state')
+        cp = self.git('--no-optional-locks status --porcelain=v2 --branch '
+                      '--untracked-files=no', check=False,
+                      capture_stdout=True, capture_stderr=True)
+        if cp.returncode:
+            return not_cloned
+        head = branch = None
+        dirty = False
+        for line in cp.stdout.decode('utf-8').splitlines():
+            if line.startswith('# branch.oid '):
+                oid = line.split()[2]
+                head = None if oid == '(initial)' else oid
+            elif line.startswith('# branch.head '):
+                name = line[len('# branch.head '):]
+                branch = None if name == '(detached)' else name
+            elif not line.startswith('#'):
+                dirty = True
+
+        cp = self.git(['for-each-ref', '--format=%(objectname)',
+                       QUAL_MANIFEST_REV_BRANCH], capture_stdout=True)
+        manifest_rev = cp.stdout.decode('utf-8').strip() or None
+
+        if head is None or manifest_rev is None:
+            is_ancestor = None
+        elif head == manifest_rev:
+            is_ancestor = True
+        else:
+            is_ancestor = self.is_ancestor_of(manifest_rev, head)
+
+        return ProjectState(True, head, branch, manifest_rev, is_ancestor,
+                            dirty)
+
     def read_at(self, path, rev=None, cwd=None):
         '''Read file contents in the project at a specific revision.
 
@@ -1377,6 +1609,45 @@ class Project:
         return [f.decode(encoding).split('\t', 1)[1]
                 for f in out.split(b'\x00') if f]
 
+class _GitStream:
+    # Project.git_stream() helper: iterate over the output of a git
+    # command as it runs.
+
+    def __init__(self, args, cwd, chunk_size, project_name):
+        self.args = args
+        self.returncode = None
+        self._cmd_str = util.quote_sh_list(args)
+        self._cwd = cwd
+        self._project_name = project_name
+        self._size = 0
+        _logger.debug(f"running '{self._cmd_str}' in {cwd} (streaming)")
+        self._start = perf_counter()
+        self._popen = subprocess.Popen(args, cwd=cwd, stdout=subprocess.PIPE)
+        self._chunk_size = chunk_size
+
+    def __iter__(self):
+        try:
+            while True:
+                chunk = self._popen.stdout.read1(self._chunk_size)
+                if not chunk:
+                    break
+                self._size += len(chunk)
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        # Stop reading git's output and get its exit code. If the
+        # caller gave up early, git gets an error writing and exits.
+        if self.returncode is not None:
+            return
+        self._popen.stdout.close()
+        self.returncode = self._popen.wait()
+        trace.record_git_call(self.args, self._cwd, self._start,
+                              self.returncode, self._size,
+                              project=self._project_name)
+        _logger.debug('"%s" exit code: %d', self._cmd_str, self.returncode)
+
 # FIXME: this whole class should just go away. See #327.
 class ManifestProject(Project):
     '''Represents the manifest repository as a `Project`.
@@ -1403,6 +1674,8 @@ class ManifestProject(Project):
       can fetch a manifest repository from a Git remote
     - ``revision``: ``"HEAD"``
     - ``clone_depth``: ``None``, because ``url`` is
+    - ``fetch_tags``: ``None``, for the same reason
+    - ``groups``: empty; the manifest repository is always active
     '''
 
     def __repr__(self):
@@ -1481,6 +1754,23 @@ class ManifestProject(Project):
     def clone_depth(self, clone_depth):
         raise ValueError(clone_depth)
 
+    @property
+    def fetch_tags(self):
+        return None
+
+    @fetch_tags.setter
+    def fetch_tags(self, fetch_tags):
+        raise ValueError(fetch_tags)
+
+    @property
+    def groups(self):
+        return []
+
+    @groups.setter
+    def groups(self, groups):
+        if groups:
+            raise ValueError(groups)
+
     def as_dict(self):
         '''Return a representation of this object as a dict, as it would be
         parsed from an equivalent YAML manifest.'''
@@ -1501,13 +1791,21 @@ _import_ctx = collections.namedtuple('_import_ctx', [
     'projects',
     # Project -> Bool. True if OK to add a project to 'projects'. A
     # None value is treated as a function which always returns True.
-    'filter_fn'])
+    'filter_fn',
+    # Project we're importing from, or None:
+    'provider',
+    # Names of projects left out because they are inactive:
+    'inactive',
+    # Map from project names to the Project they were imported
+    # from, for projects resolved via project imports:
+    'providers',
+    # Paths of the files and directories the manifest data were read
+    # from. If any of them changes, the manifest may have too:
+    'files'])
 _YML_EXTS = ['yml', 'yaml']
 _WEST_YML = 'west.yml'
 _SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "manifest-schema.yml")
-_SCHEMA_VER = parse_version(SCHEMA_VERSION)
 _EARLIEST_VER_STR = '0.6.99'  # we introduced the version feature after 0.6
-_EARLIEST_VER = parse_version(_EARLIEST_VER_STR)
 _DEFAULT_REV = 'master'
 
 def _mpath(cp=None, topdir=None):
@@ -1582,13 +1880,57 @@ def _default_importer(project, file):
     raise ManifestImportFailed(project, file)
 
 def _load(data):
+    import yaml
     try:
         return yaml.safe_load(data)
     except yaml.scanner.ScannerError as e:
         raise MalformedManifest(data) from e
 
 def _new_ctx(ctx, _new_filter):
-    return _import_ctx(ctx.projects, _and_filters(ctx.filter_fn, _new_filter))
+    return ctx._replace(filter_fn=_and_filters(ctx.filter_fn, _new_filter))
+
+def _is_group(group):
+    # Is 'group' a valid group name? Commas, whitespace and a leading
+    # '+' or '-' would be ambiguous in group filters.
+
+    return isinstance(group, str) and bool(re.fullmatch(r'[^\s,+-][^\s,]*',
+                                                        group))
+
+def _parse_group_filter(value):
+    # Parse a comma and/or whitespace separated group filter string,
+    # like "-foo,+bar", into a list. Raises ValueError on errors.
+
+    ret = []
+    for item in re.split(r'[\s,]+', value.strip()):
+        if not item:
+            continue
+        if not _is_group(item[1:] if item[0] in '+-' else item):
+            raise ValueError(f'invalid group filter element "{item}"')
+        ret.append(item)
+    return ret
+
+def _enabled_groups(group_filter):
+    # Map each group named in a group filter list to True if it
+    # ends up enabled, and False otherwise.
+
+    ret = {}
+    for item in group_filter:
+        ret[item.lstrip('+-')] = not item.startswith('-')
+    return ret
+
+def _config_groups(topdir, cp=None):
+    # The parsed value of the update.groups configuration option in
+    # *cp*, a ConfigParser which already has the configuration files
+    # read into it. If not given, read them into a new one, with the
+    # given *topdir* as west workspace root.
+
+    if cp is None:
+        cp = cfg._configparser()
+        cfg.read_config(config=cp, topdir=topdir)
+    try:
+        return _parse_group_filter(cp.get('update', 'groups', fallback=''))
+    except ValueError as e:
+        raise MalformedConfig(f'update.groups: {e}') from e
 
 def _is_imap_list(value):
     # Return True if the value is a valid import map 'blacklist' or
@@ -0,0 +1,261 @@
+# Copyright (c) 2020, Nordic Semiconductor ASA
+#
+# SPDX-License-Identifier: Apache-2.0
+
+'''Tracing support, for finding out where west spends its time.
+
+Nothing in here is public API.
+'''
+
+import collections
+import contextlib
+import json
+import os
+import sys
+import threading
+from time import perf_counter
+from typing import Dict
+
+# A git (or other) subprocess which west ran:
+#
+# - argv: the command line
+# - cwd: directory it ran in
+# - project: name of the project it ran in, or None if unknown
+# - subcommand: git subcommand, or another label for the summary
+# - seconds: how long it took
+# - returncode: its exit code
+# - stdout_size, stderr_size: number of bytes of output read from
+#   it, or None if the output wasn't captured
+_GitCall = collections.namedtuple(
+    '_GitCall',
+    'argv cwd project subcommand seconds returncode stdout_size stderr_size')
+
+# List of _GitCall, or None if git calls aren't being traced.
+_git_calls = None
+_git_calls_lock = threading.Lock()
+
+# List of Chrome trace event format "complete" events, one per
+# finished span, or None if spans aren't being traced. Timestamps are
+# in microseconds since enable_span_trace() was called. Also remember
+# the names of the threads which recorded them.
+_span_events = None
+_span_epoch = None
+_span_threads: Dict[int, str] = {}
+_span_lock = threading.Lock()
+
+def enable_git_trace():
+    # Start recording git calls.
+
+    global _git_calls
+    _git_calls = []
+
+def git_trace_enabled():
+    return _git_calls is not None
+
+def record_git_call(argv, cwd, start, returncode, stdout_size=None,
+                    stderr_size=None, project=None, subcommand=None):
+    # Record a git call which started at perf_counter() value 'start'
+    # and just finished, if git calls or spans are being traced.
+
+    if _git_calls is None and _span_events is None:
+        return
+    call = _GitCall(list(argv), cwd or os.getcwd(), project,
+                    subcommand or _git_subcommand(argv),
+                    perf_counter() - start, returncode,
+                    stdout_size, stderr_size)
+    if _git_calls is not None:
+        with _git_calls_lock:
+            _git_calls.append(call)
+    record_span(f'git {call.subcommand}', start, cat='git',
+                argv=call.argv, cwd=call.cwd, project=project,
+                returncode=returncode)
+
+def enable_span_trace():
+    # Start recording spans.
+
+    global _span_events, _span_epoch
+    _span_epoch = perf_counter()
+    _span_events = []
+
+def span_trace_enabled():
+    return _span_events is not None
+
+@contextlib.contextmanager
+def span(name, cat='west', **args):
+    # Record the time spent in a with block as a span named 'name',
+    # if spans are being traced. Spans recorded inside the block, by
+    # the same thread, nest inside it. Keyword arguments are saved
+    # with the span, and must be JSON serializable.
+
+    if _span_events is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, start, cat=cat, **args)
+
+def record_span(name, start, cat='west', **args):
+    # Record a span which started at perf_counter() value 'start' and
+    # just ended, if spans are being traced. This is for code which
+    # can't use a with block.
+
+    if _span_events is None:
+        return
+    end = perf_counter()
+    thread = threading.current_thread()
+    event = {'name': name, 'cat': cat, 'ph': 'X',
+             'ts': (start - _span_epoch) * 1e6,
+             'dur': (end - start) * 1e6,
+             'pid': os.getpid(), 'tid': thread.ident}
+    if args:
+        event['args'] = args
+    with _span_lock:
+        _span_events.append(event)
+        _span_threads[thread.ident] = thread.name
+
+def write_trace_file(path):
+    # Write the recorded spans to a file in Chrome trace event JSON
+    # format, which chrome://tracing and Perfetto can load.
+
+    with _span_lock:
+        events = list(_span_events or [])
+        threads = dict(_span_threads)
+    pid = os.getpid()
+    events.extend({'name': 'thread_name', 'ph': 'M', 'pid': pid,
+                   'tid': tid, 'args': {'name': name}}
+                  for tid, name in threads.items())
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+def git_summary():
+    # Return a table summarizing the traced git calls, grouped by
+    # subcommand and by project, as a string.
+
+    calls = list(_git_calls or [])
+    total = sum(call.seconds for call in calls)
+    lines = [f'{len(calls)} git calls, {total:.3f} seconds total', '']
+    for title, key in [('subcommand', lambda call: call.subcommand),
+                       ('project',
+                        lambda call: call.project or f'({call.cwd})')]:
+        lines.extend(_summary_table(title, calls, key))
+        lines.append('')
+    return '\n'.join(lines)
+
+def write_git_summary(path):
+    # Write git_summary() to a file, or standard error if path is '-'.
+
+    summary = git_summary()
+    if path == '-':
+        print(summary, file=sys.stderr, end='')
+    else:
+        with open(path, 'w') as f:
+            f.write(summary)
+
+def _summary_table(title, calls, key):
+    # git_summary() helper: one table with a row per group of calls,
+    # slowest group first.
+
+    groups = collections.OrderedDict()
+    for call in calls:
+        groups.setdefault(key(call), []).append(call)
+
+    rows = []
+    for name, group in groups.items():
+        rows.append((name, len(group),
+                     sum(1 for call in group if call.returncode),
+                     sum(call.seconds for call in group),
+                     max(call.seconds for call in group),
+                     _size(call.stdout_size for call in group),
+                     _size(call.stderr_size for call in group)))
+    rows.sort(key=lambda row: row[3], reverse=True)
+
+    width = max([len(title)] + [len(row[0]) for row in rows])
+    ret = [f'{title:{width}}  {"calls":>6}  {"failed":>6}  {"seconds":>9}  '
+           f'{"max":>8}  {"stdout":>10}  {"stderr":>10}']
+    for name, count, failed, seconds, slowest, stdout, stderr in rows:
+        ret.append(f'{name:{width}}  {count:6}  {failed:6}  {seconds:9.3f}  '
+                   f'{slowest:8.3f}  {stdout:>10}  {stderr:>10}')
+    return ret
+
+def _size(sizes):
+    # Total of the known sizes, as a string, or '-' if none are known.
+
+    known = [size for size in sizes if size is not None]
+    return str(sum(known)) if known else '-'
+
+def _git_subcommand(argv):
+    # Find the subcommand in a git command line, skipping global
+    # options like '-C DIR' and '--no-optional-locks'.
+
+    if not argv or os.path.basename(argv[0]) not in ('git', 'git.exe'):
+        return os.path.basename(argv[0]) if argv else '?'
+    args = iter(argv[1:])
+    for arg in args:
+        if arg in ('-C', '-c', '--git-dir', '--work-tree'):
+            next(args, None)
+        elif not arg.startswith('-'):
+            return arg
+    return '?'
+
+@contextlib.contextmanager
+def profile(dest=None, memory=False):
+    # Profile the code in a with block with cProfile, if dest is not
+    # None. If dest is '-', the functions which took the most time are
+    # printed to stderr afterwards. Otherwise, the profile is saved to
+    # the file dest, for the pstats module or other tools to read.
+    #
+    # Only the calling thread is profiled.
+    #
+    # If memory is true, also trace memory allocations with
+    # tracemalloc, and print the peak memory use and the biggest
+    # allocations to stderr afterwards.
+
+    if dest is None and not memory:
+        yield
+        return
+
+    # These are only needed here, so import them here.
+    import cProfile
+    import tracemalloc
+
+    if memory:
+        tracemalloc.start()
+    profiler = cProfile.Profile() if dest is not None else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            _write_profile(profiler, dest)
+        if memory:
+            _write_memory_report(tracemalloc)
+            tracemalloc.stop()
+
+def _write_profile(profiler, dest):
+    # profile() helper for saving or printing the results.
+
+    if dest != '-':
+        profiler.dump_stats(dest)
+        return
+
+    import pstats
+
+    print('profile, sorted by cumulative time:', file=sys.stderr)
+    pstats.Stats(profiler, stream=sys.stderr).sort_stats(
+        'cumulative').print_stats(40)
+
+def _write_memory_report(tracemalloc):
+    # profile() helper for the memory report.
+
+    _, peak = tracemalloc.get_traced_memory()
+    stats = tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(False, tracemalloc.__file__)]).statistics(
+            'lineno')
+    print(f'peak traced memory: {peak / 2**20:.1f} MiB', file=sys.stderr)
+    print('biggest allocations still in use:', file=sys.stderr)
+    for stat in stats[:10]:
+        print(f'  {stat}', file=sys.stderr)
@@ -5,7 +5,7 @@ import itertools
 import os
 import sys
 
-from west.app.main import BUILTIN_COMMAND_GROUPS
+from west.app.main import BUILTIN_COMMAND_GROUPS, WestApp
 from conftest import cmd
 
 def test_builtin_help_and_dash_h(west_init_tmpdir):
@@ -16,12 +16,23 @@ def test_builtin_help_and_dash_h(west_init_tmpdir):
     h2out = cmd('-h')
     assert h1out == h2out
 
-    for cls in itertools.chain(*BUILTIN_COMMAND_GROUPS.values()):
-        c = cls()
-        h1out = cmd(f'help {c.name}')
-        h2out = cmd(f'{c.name} -h')
+    for name, _, _ in itertools.chain(*BUILTIN_COMMAND_GROUPS.values()):
+        h1out = cmd(f'help {name}')
+        h2out = cmd(f'{name} -h')
         assert h1out == h2out
 
+def test_builtin_parsers_are_lazy():
+    # Only stubs are registered for built-in commands until one of
+    # them needs its real parser.
+
+    app = WestApp()
+    app.setup_parsers()
+    assert not any(hasattr(command, 'parser')
+                   for command in app.builtins.values())
+
+    app.command_parser(app.builtins['list'])
+    assert app.builtins['list'].parser.prog == 'west list'
+
 def test_extension_help_and_dash_h(west_init_tmpdir):
     # Test "west help <command>" and "west <command> -h" for extension
     # commands (west_init_tmpdir has a command with one).
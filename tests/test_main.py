@@ -0,0 +1,61 @@
+# Copyright (c) 2020, Nordic Semiconductor ASA
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import subprocess
+import sys
+
+from conftest import cmd
+
+def test_topdir_imports(west_init_tmpdir):
+    # 'west topdir' shouldn't import the modules west only needs to
+    # parse or write YAML and configuration files, or the modules
+    # with the other built-in commands, and importing west should stay
+    # within a budget. The budget is deliberately loose, to catch
+    # regressions like importing a big dependency again without
+    # failing on slow machines.
+
+    env = dict(os.environ, PYTHONPROFILEIMPORTTIME='1')
+    out = cmd('topdir', env=env, stderr=subprocess.STDOUT)
+
+    # Lines look like 'import time: <self us> | <cumulative us> | <name>'
+    times = {}
+    for line in out.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+
+    assert 'west.app.main' in times
+    assert times['west.app.main'] < 500000, 'import time budget exceeded'
+
+    # Built-in command modules are imported with importlib, which
+    # PYTHONPROFILEIMPORTTIME doesn't report, so look at sys.modules.
+    modules = subprocess.check_output(
+        [sys.executable, '-c',
+         'import sys\n'
+         'from west.app.main import main\n'
+         'main(["topdir"])\n'
+         'print(*sys.modules)\n'],
+        universal_newlines=True).splitlines()[-1].split()
+    assert 'west.app.topdir' in modules
+    for unneeded in ['yaml', 'pykwalify', 'packaging', 'configobj',
+                     'west.app.project', 'west.app.config',
+                     'west.app.daemon', 'west.app.batch', 'socket']:
+        assert unneeded not in modules, f'west topdir imported {unneeded}'
+
+def test_batch_imports(west_init_tmpdir):
+    # 'west batch' shares some helpers with 'west daemon', but
+    # shouldn't need to import it.
+
+    modules = subprocess.check_output(
+        [sys.executable, '-c',
+         'import sys\n'
+         'from west.app.main import main\n'
+         'main(["batch"])\n'
+         'print(*sys.modules)\n'],
+        input='', stderr=subprocess.DEVNULL,
+        universal_newlines=True).splitlines()[-1].split()
+    assert 'west.app.batch' in modules
+    assert 'west.app.daemon' not in modules
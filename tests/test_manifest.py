@@ -450,6 +450,66 @@ def test_project_clone_depth():
     assert ps[1].clone_depth is None
     assert ps[2].clone_depth == 4
 
+def test_project_fetch_tags():
+    ps = M('''\
+    projects:
+    - name: foo
+      url: u1
+    - name: bar
+      url: u2
+      fetch-tags: needed
+    ''').projects
+    assert ps[1].fetch_tags is None
+    assert ps[2].fetch_tags == 'needed'
+    assert ps[2].as_dict()['fetch-tags'] == 'needed'
+
+    with pytest.raises(MalformedManifest):
+        M('''\
+        projects:
+        - name: foo
+          url: u1
+          fetch-tags: some
+        ''')
+
+def test_project_groups():
+    content = '''\
+    projects:
+    - name: foo
+      url: u1
+    - name: bar
+      url: u2
+      groups: [hal]
+    - name: baz
+      url: u3
+      groups: [hal, nordic]
+    '''
+    ps = M(content).projects
+    assert [p.groups for p in ps] == [[], [], ['hal'], ['hal', 'nordic']]
+    assert 'groups' not in ps[1].as_dict()
+    assert ps[2].as_dict()['groups'] == ['hal']
+
+    # Projects are inactive when all of their groups are disabled.
+    # Later group filter elements override earlier ones.
+    def names(group_filter):
+        return [p.name for p in M(content, group_filter=group_filter).projects]
+
+    assert names(['-hal']) == ['manifest', 'foo', 'baz']
+    assert names(['-hal', '-nordic']) == ['manifest', 'foo']
+    assert names(['-hal', '-nordic', '+hal']) == ['manifest', 'foo', 'bar',
+                                                  'baz']
+    assert names(['-unknown']) == ['manifest', 'foo', 'bar', 'baz']
+
+    with pytest.raises(MalformedManifest):
+        M('''\
+        projects:
+        - name: foo
+          url: u1
+          groups: [-foo]
+        ''')
+
+    with pytest.raises(ValueError):
+        ManifestProject().groups = ['foo']
+
 def test_project_west_commands():
     # Projects may also specify subdirectories with west commands.
 
@@ -1144,7 +1204,7 @@ def test_version_check_failure():
     with pytest.raises(MalformedManifest):
         Manifest.from_data(invalid_fmt.format('0.6.98'))
 
-@pytest.mark.parametrize('ver', ['0.6.99'])
+@pytest.mark.parametrize('ver', ['0.6.99', '0.7', '0.8'])
 def test_version_check_success(ver):
     # Test that version checking succeeds when it should.
 
@@ -1192,6 +1252,44 @@ def test_import_false_ok():
     ''')
     assert manifest.projects[-1].name == 'foo'
 
+def test_import_groups():
+    # Imported projects inherit the groups of the project they're
+    # imported from, and projects from an inactive project's import
+    # are never resolved.
+
+    call_map = {('hals', 'west.yml'): '''
+    manifest:
+      projects:
+        - name: hal_nordic
+          url: u2
+          groups: [nordic]
+        - name: hal_st
+          url: u3
+    '''}
+    content = '''\
+    projects:
+      - name: hals
+        url: u1
+        groups: [hal]
+        import: true
+    '''
+
+    ps = M(content, importer=make_importer(call_map),
+           import_flags=FPI).projects
+    assert [(p.name, p.groups) for p in ps[1:]] == [
+        ('hals', ['hal']),
+        ('hal_nordic', ['nordic', 'hal']),
+        ('hal_st', ['hal'])]
+
+    # hal_nordic is still active through its inherited hal group.
+    ps = M(content, importer=make_importer(call_map), import_flags=FPI,
+           group_filter=['-nordic']).projects
+    assert [p.name for p in ps[1:]] == ['hals', 'hal_nordic', 'hal_st']
+
+    ps = M(content, importer=make_importer({}), import_flags=FPI,
+           group_filter=['-hal']).projects
+    assert [p.name for p in ps] == ['manifest']
+
 # A stand-in for zephyr/west.yml to use when testing manifest imports.
 # This feature isn't tied to Zephyr in any way, but we write the tests
 # this way to make them easier to read and relate to Zephyr use cases.
@@ -1,21 +1,26 @@
 # Copyright (c) 2020, Nordic Semiconductor ASA
 
 import collections
+import json
 import os
+import pstats
 import re
 import shlex
+import socket
 import subprocess
 import textwrap
+import time
 from pathlib import PurePath
 
 import pytest
 
 from west import configuration as config
+from west.app.workspace import Workspace
 from west.manifest import Manifest, ManifestProject, Project, \
     ManifestImportFailed
 from west.manifest import ImportFlag as MIF
 from conftest import create_workspace, create_repo, add_commit, add_tag, \
-    check_output, cmd, GIT, rev_parse, check_proj_consistency
+    check_output, cmd, GIT, rev_parse, check_proj_consistency, create_branch
 
 #
 # Helpers
@@ -167,6 +172,32 @@ def test_diff(west_init_tmpdir):
 
     cmd('update Kconfiglib')
 
+    # Diffs are streamed after a banner for each project with changes.
+    wct = west_init_tmpdir
+    kconfiglib = wct / 'subdir' / 'Kconfiglib'
+    add_commit(str(kconfiglib), 'add a file', files={'file.txt': 'old\n'})
+    kconfiglib.join('file.txt').write('new\n')
+    out = cmd('diff')
+    assert 'diff for Kconfiglib (subdir/Kconfiglib):' in out
+    assert 'net-tools' not in out
+    assert out.index('diff for Kconfiglib') < \
+        out.index('+++ subdir/Kconfiglib/file.txt') < out.index('new')
+
+    # Colors are stripped when stdout isn't a terminal.
+    out = subprocess.run(['west', 'diff'], stdout=subprocess.PIPE).stdout
+    assert b'+new' in out
+    assert b'\x1b[' not in out
+
+    project = Manifest.from_file(topdir=wct).get_projects(['Kconfiglib'])[0]
+    stream = project.git_stream('diff --exit-code', chunk_size=1)
+    assert b''.join(stream).endswith(b'+new\n')
+    assert stream.returncode == 1
+
+    stream = project.git_stream('log')
+    next(iter(stream))
+    stream.close()
+    assert stream.returncode is not None
+
 
 def test_status(west_init_tmpdir):
     # FIXME: Check output
@@ -200,6 +231,235 @@ def test_forall(west_init_tmpdir):
     cmd('forall -c "echo *"')
 
 
+def test_trace_git(west_init_tmpdir):
+    # 'west --trace-git' summarizes the git commands a command ran,
+    # grouped by subcommand and by project.
+
+    out = cmd('--trace-git update net-tools',
+              stderr=subprocess.STDOUT)
+    assert 'git calls' in out
+    assert re.search(r'^fetch\s+\d+\s+0\s', out, re.MULTILINE)
+    assert re.search(r'^net-tools\s+\d+', out, re.MULTILINE)
+    assert not re.search(r'^Kconfiglib\s', out, re.MULTILINE)
+
+    trace_file = west_init_tmpdir / 'trace.txt'
+    cmd(f'--trace-git={trace_file} forall -c "echo hello"')
+    summary = trace_file.read_text(encoding='utf-8')
+    assert 'git calls' in summary
+    assert re.search(r'^\(forall command\)\s+2\s', summary, re.MULTILINE)
+
+
+def test_trace_file(west_init_tmpdir):
+    # 'west --trace-file FILE' writes spans in Chrome trace event
+    # format, with the git calls nested inside the update phases.
+
+    trace_file = west_init_tmpdir / 'trace.json'
+    cmd(f'--trace-file {trace_file} update net-tools')
+    with open(trace_file) as f:
+        events = json.load(f)['traceEvents']
+
+    spans = {event['name']: event for event in events
+             if event['ph'] == 'X'}
+    assert 'west' in spans
+    assert 'load manifest' in spans
+    for name in ['update net-tools', 'fetch net-tools',
+                 'checkout net-tools']:
+        assert spans[name]['cat'] == 'update'
+    assert 'update Kconfiglib' not in spans
+
+    fetch = spans['fetch net-tools']
+    git_fetch = spans['git fetch']
+    assert git_fetch['args']['project'] == 'net-tools'
+    assert fetch['ts'] <= git_fetch['ts']
+    assert (git_fetch['ts'] + git_fetch['dur'] <=
+            fetch['ts'] + fetch['dur'])
+    assert any(event['ph'] == 'M' and event['name'] == 'thread_name'
+               for event in events)
+
+
+def test_profile(west_init_tmpdir):
+    # 'west --profile' profiles the whole command.
+
+    out = cmd('--profile --profile-memory list', stderr=subprocess.STDOUT)
+    assert 'sorted by cumulative time' in out
+    assert '(_run)' in out
+    assert 'peak traced memory' in out
+
+    profile = west_init_tmpdir / 'west.prof'
+    cmd(f'--profile={profile} list')
+    stats = pstats.Stats(str(profile))
+    assert any(func[2] == 'do_run' for func in stats.stats)
+
+def test_lazy_manifest(west_init_tmpdir):
+    # Built-in commands which don't need the manifest run without
+    # loading it.
+
+    def loads_manifest(command):
+        trace_file = west_init_tmpdir / 'trace.json'
+        cmd(f'--trace-file {trace_file} {command}')
+        with open(trace_file) as f:
+            return any(event['name'] == 'load manifest'
+                       for event in json.load(f)['traceEvents'])
+
+    assert not loads_manifest('topdir')
+    assert not loads_manifest('config manifest.path')
+    assert not loads_manifest('-v --version')
+    assert loads_manifest('list')
+    assert loads_manifest('help')
+
+
+def test_extension_spec_cache(west_init_tmpdir):
+    # Extension command specs are cached in .west, keyed by the
+    # west-commands file's path, mtime and size.
+
+    cmd('update net-tools')
+    assert 'Testing test command 1' in cmd('test-extension')
+
+    cache_file = west_init_tmpdir / '.west' / 'extension-commands.json'
+    with open(cache_file) as f:
+        cache = json.load(f)
+    spec_file = str(west_init_tmpdir.join('net-tools', 'scripts',
+                                          'west-commands.yml'))
+    assert list(cache) == [spec_file]
+    commands = cache[spec_file]['west-commands'][0]['commands']
+    assert commands[0]['help'] == 'test-extension-help'
+
+    # While the file is unchanged, the cached contents are used
+    # instead of parsing it again.
+    commands[0]['help'] = 'cached-help'
+    with open(cache_file, 'w') as f:
+        json.dump(cache, f)
+    assert 'cached-help' in cmd('help')
+
+    # Changing the file invalidates the cache entry.
+    west_commands = west_init_tmpdir / 'net-tools' / 'scripts' / \
+        'west-commands.yml'
+    west_commands.write(west_commands.read().replace('test-extension-help',
+                                                     'new-help'))
+    help_out = cmd('help')
+    assert 'new-help' in help_out
+    assert 'cached-help' not in help_out
+    with open(cache_file) as f:
+        assert 'new-help' in f.read()
+
+
+def test_workspace_cache(west_init_tmpdir):
+    # The workspace context computes things once, until west writes a
+    # configuration file.
+
+    topdir = str(west_init_tmpdir)
+    ws = Workspace(topdir)
+    manifest = ws.manifest
+    assert ws.manifest is manifest
+    assert ws.manifest_path == 'zephyr'
+    assert ws.group_filter == []
+
+    # Callers may modify the group filter they get.
+    ws.group_filter.append('-foo')
+    assert ws.group_filter == []
+
+    config.update_config('update', 'groups', '-foo', topdir=topdir)
+    try:
+        assert ws.config.get('update', 'groups') == '-foo'
+        assert ws.group_filter == ['-foo']
+        assert ws.manifest is not manifest
+        assert ws.manifest.group_filter == ['-foo']
+    finally:
+        config.delete_config('update', 'groups', topdir=topdir)
+    assert not ws.config.has_option('update', 'groups')
+
+
+@pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'),
+                    reason='west daemon needs Unix domain sockets')
+def test_daemon(west_init_tmpdir):
+    # 'west daemon' runs read-only commands for other west processes,
+    # and loads the manifest again when it changes.
+
+    sock = west_init_tmpdir / '.west' / 'daemon.sock'
+    daemon = subprocess.Popen(['west', 'daemon'], stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT,
+                              universal_newlines=True)
+    try:
+        for _ in range(300):
+            if sock.check() or daemon.poll() is not None:
+                break
+            time.sleep(0.1)
+        assert sock.check()
+
+        assert cmd('topdir').strip() == PurePath(west_init_tmpdir).as_posix()
+        assert cmd('list -f {name}').split() == \
+            ['manifest', 'Kconfiglib', 'tagged_repo', 'net-tools']
+        with pytest.raises(subprocess.CalledProcessError) as e:
+            cmd('list --bogus', stderr=subprocess.STDOUT)
+        assert e.value.returncode == 2
+        assert b'unexpected arguments' in e.value.output
+
+        west_yml = west_init_tmpdir / 'zephyr' / 'west.yml'
+        west_yml.write(west_yml.read().replace('- name: tagged_repo',
+                                               '- name: renamed_repo'))
+        assert 'renamed_repo' in cmd('list -f {name}')
+
+        # This one runs without the daemon.
+        env = dict(os.environ, WEST_NO_DAEMON='1')
+        assert 'renamed_repo' in cmd('list -f {name}', env=env)
+
+        cmd('daemon --stop')
+        out = daemon.communicate(timeout=60)[0]
+    finally:
+        if daemon.poll() is None:
+            daemon.kill()
+            daemon.communicate()
+
+    assert not sock.check()
+    assert 'reloading the workspace' in out
+    assert out.count("west list -f '{name}': exit code 0") == 2
+
+
+def test_batch(west_init_tmpdir):
+    # 'west batch' runs many commands, loading the manifest again only
+    # when a command changes the files it was loaded from.
+
+    batch = west_init_tmpdir / 'batch.txt'
+    batch.write(textwrap.dedent('''\
+    # A comment, and a blank line.
+
+    west list -f {name}
+    list nosuch
+    config foo.bar baz
+    config foo.bar
+    config -d foo.bar
+    topdir
+    batch
+    '''))
+    trace_file = west_init_tmpdir / 'trace.json'
+
+    with pytest.raises(subprocess.CalledProcessError) as e:
+        cmd(f'--trace-file {trace_file} batch {batch}',
+            stderr=subprocess.STDOUT)
+    out = e.value.output.decode()
+    assert e.value.returncode == 1
+    assert out.startswith('manifest\nKconfiglib\ntagged_repo\nnet-tools\n')
+    assert 'baz\n' in out
+    assert PurePath(west_init_tmpdir).as_posix() in out
+    assert "\"west batch\" can't run in a batch" in out
+    assert textwrap.dedent('''\
+    west batch: 7 commands, 2 failed
+      line 3: exit code 0: west list -f '{name}'
+      line 4: exit code 1: west list nosuch
+      line 5: exit code 0: west config foo.bar baz
+      line 6: exit code 0: west config foo.bar
+      line 7: exit code 0: west config -d foo.bar
+      line 8: exit code 0: west topdir
+      line 9: exit code 1: west batch
+    ''') in out
+
+    # The manifest was loaded once, then again after each of the two
+    # 'west config' commands which changed the local configuration.
+    with open(trace_file) as f:
+        assert sum(event['name'] == 'load manifest'
+                   for event in json.load(f)['traceEvents']) == 3
+
+
 def test_update_projects(west_init_tmpdir):
     # Test the 'west update' command. It calls through to the same backend
     # functions that are used for automatic updates and 'west init'
@@ -327,13 +587,430 @@ def test_update_tag_to_tag(west_init_tmpdir):
     assert ur.tr_head_0 == v1_0
     assert ur.tr_head_1 == v2_0
 
+def test_fetch(west_init_tmpdir):
+    # 'west fetch' should move manifest-rev without touching HEAD or
+    # the working tree, and 'west update' should then check it out.
+
+    wct = west_init_tmpdir
+    kconfiglib_remote = str(wct / '..' / 'repos' / 'Kconfiglib')
+    kconfiglib = str(wct / 'subdir' / 'Kconfiglib')
+
+    # Uncloned projects get initialized, but nothing is checked out.
+    cmd('fetch -j 2')
+    assert rev_parse(kconfiglib, 'manifest-rev') == \
+        rev_parse(kconfiglib_remote, 'zephyr')
+    assert not os.path.exists(os.path.join(kconfiglib, 'kconfiglib.py'))
+
+    cmd('update')
+    head_0 = rev_parse(kconfiglib, 'HEAD')
+
+    add_commit(kconfiglib_remote, 'new kconfiglib commit',
+               files={'kconfiglib.py': 'new contents'})
+    cmd('fetch Kconfiglib')
+    assert rev_parse(kconfiglib, 'manifest-rev') == \
+        rev_parse(kconfiglib_remote, 'zephyr')
+    assert rev_parse(kconfiglib, 'HEAD') == head_0
+    assert check_output([GIT, 'status', '--porcelain'], cwd=kconfiglib) == ''
+
+    cmd('update Kconfiglib')
+    assert rev_parse(kconfiglib, 'HEAD') == \
+        rev_parse(kconfiglib_remote, 'zephyr')
+
+def test_update_offline(west_init_tmpdir):
+    # 'west update --offline' should work using only what's available
+    # locally, and fail clearly for projects where that isn't enough.
+
+    wct = west_init_tmpdir
+    remotes = wct / '..' / 'repos'
+    kconfiglib_remote = str(remotes / 'Kconfiglib')
+    kconfiglib = str(wct / 'subdir' / 'Kconfiglib')
+
+    # Projects that aren't cloned can't be updated.
+    with pytest.raises(subprocess.CalledProcessError):
+        cmd('update --offline Kconfiglib', stderr=subprocess.STDOUT)
+
+    cmd('update')
+    add_commit(kconfiglib_remote, 'new kconfiglib commit')
+    expected = rev_parse(kconfiglib_remote, 'zephyr')
+    cmd('fetch Kconfiglib')
+
+    # Make sure the network really isn't used by getting rid of the
+    # remotes, then check we can update to what was fetched.
+    remotes.rename(wct / '..' / 'repos-gone')
+    cmd('update --offline')
+    assert rev_parse(kconfiglib, 'HEAD') == expected
+
+    # Branches which weren't fetched can't be used.
+    manifest = Manifest.from_file(topdir=wct)
+    manifest.get_projects(['Kconfiglib'])[0].revision = 'unknown-branch'
+    with open(wct / 'zephyr' / 'west.yml', 'w') as f:
+        f.write(manifest.as_yaml())
+    with pytest.raises(subprocess.CalledProcessError) as e:
+        cmd('update --offline Kconfiglib', stderr=subprocess.STDOUT)
+    assert 'run "west fetch" while online first' in e.value.output.decode()
+
+    with pytest.raises(subprocess.CalledProcessError):
+        cmd('update --offline --fetch=always')
+
+def test_bundle(west_update_tmpdir):
+    # 'west bundle create' should save everything 'west init
+    # --from-bundle' needs to recreate the workspace without the
+    # network, including shallow projects (net-tools).
+
+    wct = west_update_tmpdir
+    bundle = str(wct / '..' / 'bundle')
+    cmd(f'bundle create {bundle}')
+    expected = cmd('list -f "{name} {path}"')
+    heads = {path: rev_parse(str(wct / path), 'HEAD')
+             for path in ['subdir/Kconfiglib', 'tagged_repo', 'net-tools']}
+
+    with pytest.raises(subprocess.CalledProcessError):
+        cmd(f'bundle create {bundle}')
+
+    (wct / '..' / 'repos').rename(wct / '..' / 'repos-gone')
+    new = wct / '..' / 'from-bundle'
+    cmd(f'init --from-bundle {bundle} {new}', cwd=str(wct / '..'))
+
+    assert cmd('list -f "{name} {path}"', cwd=str(new)) == expected
+    for path, head in heads.items():
+        assert rev_parse(str(new / path), 'HEAD') == head
+    assert new.join('net-tools', 'qemu-script.sh').check(file=1)
+    assert new.join('zephyr', 'west.yml').check(file=1)
+
+def test_update_jobs(west_init_tmpdir):
+    # Parallel updates should work, and record per-project history
+    # which is used to start the slowest projects first next time.
+
+    wct = west_init_tmpdir
+    history_file = wct / '.west' / 'update-history.json'
+
+    # Sequential updates don't need it, so they don't record it.
+    cmd('update -j 1')
+    assert not history_file.exists()
+
+    cmd('update -j 3')
+    history = json.loads(history_file.read())
+    assert set(history) == {'Kconfiglib', 'tagged_repo', 'net-tools'}
+    for entry in history.values():
+        assert entry['seconds'] >= 0
+        assert entry['size'] >= 0
+
+    for path in ['subdir/Kconfiglib', 'tagged_repo', 'net-tools']:
+        assert rev_parse(str(wct / path), 'HEAD') == \
+            rev_parse(str(wct / path), 'manifest-rev')
+    cmd('update -j 2')
+
+def test_update_pipeline(west_init_tmpdir):
+    # With different numbers of fetch and checkout jobs, updates go
+    # through a two stage pipeline, and should still work, including
+    # with failures in either stage.
+
+    wct = west_init_tmpdir
+    cmd('config update.fetch-jobs 3')
+    cmd('config update.checkout-jobs 1')
+    cmd('update --stats')
+    for path in ['subdir/Kconfiglib', 'tagged_repo', 'net-tools']:
+        assert rev_parse(str(wct / path), 'HEAD') == \
+            rev_parse(str(wct / path), 'manifest-rev')
+
+    # A failed fetch or checkout only fails that project.
+    remotes = wct / '..' / 'repos'
+    add_commit(str(remotes / 'Kconfiglib'), 'new commit',
+               files={'new-file': 'upstream'})
+    (wct / 'subdir' / 'Kconfiglib' / 'new-file').write('local')
+    (remotes / 'net-tools').rename(remotes / 'net-tools.bak')
+    with pytest.raises(subprocess.CalledProcessError):
+        cmd('update')
+    (remotes / 'net-tools.bak').rename(remotes / 'net-tools')
+    assert rev_parse(str(wct / 'subdir' / 'Kconfiglib'), 'HEAD') != \
+        rev_parse(str(wct / 'subdir' / 'Kconfiglib'), 'manifest-rev')
+
+    cmd('config update.checkout-jobs 0')
+    assert 'update.checkout-jobs=0' in cmd('update net-tools',
+                                           stderr=subprocess.STDOUT)
+
+def test_lpt_order():
+    # Projects which took longest last time go first. Unknown ones
+    # are treated as the slowest, unless they have a clone depth.
+    from west.app.project import _lpt_order
+
+    projects = [Project('fast', 'u'), Project('new', 'u'),
+                Project('slow', 'u'), Project('shallow', 'u', clone_depth=1)]
+    history = {'fast': {'seconds': 1}, 'slow': {'seconds': 5},
+               'bogus': 'not a dict'}
+    assert [p.name for p in _lpt_order(projects, history)] == \
+        ['new', 'slow', 'shallow', 'fast']
+    assert _lpt_order(projects, {}) == projects
+
+def test_init_reference(west_update_tmpdir):
+    # 'west init --reference' should make the manifest repository and
+    # projects in the new workspace borrow objects from the old one.
+
+    wct = west_update_tmpdir
+    manifest = wct / '..' / 'repos' / 'zephyr'
+    new = wct / '..' / 'referencing'
+
+    # Shallow clones in the reference workspace aren't used, since
+    # they don't have all the history.
+    shallow = wct / 'net-tools' / '.git' / 'shallow'
+    shallow.write(rev_parse(wct / 'net-tools', 'HEAD'))
+
+    cmd(f'init -m "{manifest}" --reference "{wct}" "{new}"',
+        cwd=str(wct / '..'))
+    assert cmd('config update.reference', cwd=str(new)).strip() == str(wct)
+    cmd('update', cwd=str(new))
+
+    for path in ['zephyr', 'subdir/Kconfiglib', 'tagged_repo']:
+        alternates = new / path / '.git' / 'objects' / 'info' / 'alternates'
+        assert alternates.read().splitlines() == \
+            [str(wct / path / '.git' / 'objects')]
+    assert not (new / 'net-tools' / '.git' / 'objects' / 'info' /
+                'alternates').check()
+
+    with pytest.raises(subprocess.CalledProcessError):
+        cmd(f'init -m "{manifest}" --reference "{new / ".."}" "{new}2"',
+            cwd=str(wct / '..'))
+
+def test_update_pools(west_init_tmpdir):
+    # With update.pools, forks of the same project should share their
+    # objects through a pool in .west.
+
+    wct = west_init_tmpdir
+    remotes = wct / '..' / 'repos'
+    kconfiglib_remote = str(remotes / 'Kconfiglib')
+    fork_remote = str(remotes / 'Kconfiglib-fork')
+    subprocess.check_call([GIT, 'clone', '-q', '-b', 'zephyr',
+                           kconfiglib_remote, fork_remote])
+    add_commit(fork_remote, 'fork commit')
+
+    manifest = Manifest.from_file(topdir=wct)
+    manifest.projects.append(Project('fork', fork_remote,
+                                     revision='zephyr'))
+    with open(wct / 'zephyr' / 'west.yml', 'w') as f:
+        f.write(manifest.as_yaml())
+
+    cmd('config update.pools true')
+    cmd('update Kconfiglib fork')
+
+    root = check_output([GIT, 'rev-list', '--max-parents=0', 'zephyr'],
+                        cwd=kconfiglib_remote).split()[-1]
+    pool = wct / '.west' / 'pools' / f'{root}.git'
+    pool_refs = check_output([GIT, 'for-each-ref', '--format=%(refname)'],
+                             cwd=str(pool)).split()
+    assert pool_refs == ['refs/west-pool/Kconfiglib', 'refs/west-pool/fork']
+
+    for path in ['subdir/Kconfiglib', 'fork']:
+        alternates = wct / path / '.git' / 'objects' / 'info' / 'alternates'
+        assert str(pool / 'objects') in alternates.read().splitlines()
+        assert rev_parse(str(wct / path), 'HEAD') == \
+            rev_parse(str(wct / path), 'manifest-rev')
+        subprocess.check_call([GIT, 'fsck'], cwd=str(wct / path))
+
+    # Shallow projects don't go in pools.
+    cmd('update net-tools')
+    assert len((wct / '.west' / 'pools').listdir()) == 1
+
+    # Projects from another family get their own pool, and only
+    # borrow from that one once they're fetched.
+    unrelated_remote = str(remotes / 'unrelated')
+    create_repo(unrelated_remote)
+    subprocess.check_call([GIT, 'commit', '-q', '--amend', '--allow-empty',
+                           '-m', 'unrelated'],
+                          cwd=unrelated_remote)
+    manifest.projects.append(Project('unrelated', unrelated_remote,
+                                     revision=rev_parse(unrelated_remote,
+                                                        'HEAD').strip()))
+    with open(wct / 'zephyr' / 'west.yml', 'w') as f:
+        f.write(manifest.as_yaml())
+    cmd('update unrelated')
+    pools = (wct / '.west' / 'pools').listdir()
+    assert len(pools) == 2
+    other_pool, = [p for p in pools if p != pool]
+    unrelated = wct / 'unrelated'
+    alternates = unrelated / '.git' / 'objects' / 'info' / 'alternates'
+    assert alternates.read().splitlines() == [str(other_pool / 'objects')]
+    subprocess.check_call([GIT, 'fsck'], cwd=str(unrelated))
+
+def test_update_moved_path(west_init_tmpdir):
+    # If a project's path changes in the manifest, west update should
+    # move the existing clone rather than cloning the project again.
+
+    wct = west_init_tmpdir
+    cmd('update Kconfiglib')
+    old_path = wct / 'subdir' / 'Kconfiglib'
+    old_path.join('untracked.txt').write('keep me')
+    sha = rev_parse(str(old_path), 'HEAD')
+
+    west_yml = wct / 'zephyr' / 'west.yml'
+    west_yml.write(west_yml.read().replace('path: subdir/Kconfiglib',
+                                           'path: moved/Kconfiglib'))
+    cmd('update Kconfiglib')
+
+    new_path = wct / 'moved' / 'Kconfiglib'
+    assert not old_path.check()
+    assert new_path.join('untracked.txt').read() == 'keep me'
+    assert rev_parse(str(new_path), 'HEAD') == sha
+    assert cmd('list -f {path} Kconfiglib').strip() == 'moved/Kconfiglib'
+
+    # A path which another project now uses is left alone.
+    west_yml.write(west_yml.read().replace(
+        'path: moved/Kconfiglib',
+        'path: subdir/Kconfiglib\n    - name: other\n'
+        '      url: file://does-not-exist\n      path: moved/Kconfiglib'))
+    cmd('update Kconfiglib')
+    assert new_path.join('untracked.txt').check()
+    assert not old_path.join('untracked.txt').check()
+    assert rev_parse(str(old_path), 'HEAD') == sha
+
+def test_update_groups(west_init_tmpdir):
+    # Projects whose groups are all disabled by update.groups or
+    # --group should be left alone, and not shown by west list.
+
+    wct = west_init_tmpdir
+    west_yml = wct / 'zephyr' / 'west.yml'
+    west_yml.write(west_yml.read().replace(
+        'path: subdir/Kconfiglib',
+        'path: subdir/Kconfiglib\n      groups: [optional]'))
+
+    cmd('config -- update.groups -optional')
+    cmd('update')
+    assert not (wct / 'subdir' / 'Kconfiglib').check()
+    assert (wct / 'tagged_repo').check(dir=1)
+    assert 'Kconfiglib' not in cmd('list -f {name}').split()
+
+    cmd('update --group=+optional')
+    assert (wct / 'subdir' / 'Kconfiglib').check(dir=1)
+
+    cmd('config -- update.groups -optional,+-bad')
+    with pytest.raises(subprocess.CalledProcessError):
+        cmd('list')
+
+def test_project_state(west_init_tmpdir):
+    # Project.state() should describe a project's repository, and
+    # west status and list should work with it.
+
+    wct = west_init_tmpdir
+    manifest = Manifest.from_file(topdir=wct)
+    kconfiglib = manifest.get_projects(['Kconfiglib'])[0]
+    assert kconfiglib.state() == (False, None, None, None, None, None)
+
+    cmd('update Kconfiglib')
+    state = kconfiglib.state()
+    manifest_rev = rev_parse(kconfiglib.abspath, 'manifest-rev').strip()
+    assert state.cloned
+    assert state.head == state.manifest_rev == manifest_rev
+    assert state.branch is None
+    assert state.is_ancestor
+    assert not state.dirty
+
+    checkout_branch(kconfiglib.abspath, 'work', create=True)
+    add_commit(kconfiglib.abspath, 'local work', files={'work.txt': 'v1'})
+    state = kconfiglib.state()
+    assert state.branch == 'work'
+    assert state.head == rev_parse(kconfiglib.abspath, 'HEAD').strip()
+    assert state.head != manifest_rev
+    assert state.is_ancestor
+    assert not state.dirty
+
+    (wct / 'subdir' / 'Kconfiglib' / 'work.txt').write('v2')
+    assert kconfiglib.state().dirty
+
+    # With full=False, the working tree isn't looked at.
+    assert kconfiglib.state(full=False) == \
+        (True, None, None, manifest_rev, None, None)
+    assert manifest.get_projects(['net-tools'])[0].state(full=False) == \
+        (False, None, None, None, None, None)
+
+    # Only cloned projects get a status; asking for one which isn't
+    # cloned is an error.
+    out = cmd('status')
+    assert 'status of Kconfiglib' in out
+    assert 'status of net-tools' not in out
+    with pytest.raises(subprocess.CalledProcessError):
+        cmd('status net-tools')
+
+    assert cmd('list -f {cloned} Kconfiglib net-tools').split() == \
+        ['cloned', 'not-cloned']
+    assert cmd('list -f {sha} Kconfiglib').strip() == manifest_rev
+
+def test_update_tags_policy(west_init_tmpdir):
+    # Verify the update.tags option limits which tags get fetched.
+
+    wct = west_init_tmpdir
+    tagged_repo_remote = str(wct / '..' / 'repos' / 'tagged_repo')
+    add_commit(tagged_repo_remote, 'unneeded tagged commit')
+    add_tag(tagged_repo_remote, 'unneeded-tag')
+
+    def local_tags():
+        return check_output([GIT, 'tag', '--list'],
+                            cwd=str(wct / 'tagged_repo')).split()
+
+    # With 'needed', only the tag we are updating to is created.
+    cmd('config update.tags needed')
+    cmd('update tagged_repo')
+    assert local_tags() == ['v1.0']
+
+    # Since v1.0 is available locally, the smart fetch strategy
+    # shouldn't need to fetch it again.
+    out = cmd('update tagged_repo')
+    assert 'fetching' not in out
+
+    # With 'none', no new tags are fetched at all, but the project is
+    # still updated.
+    cmd('config update.tags none')
+    cmd('update --fetch=always tagged_repo')
+    assert local_tags() == ['v1.0']
+
+    # And 'all' gets everything, as before.
+    cmd('config update.tags all')
+    cmd('update --fetch=always tagged_repo')
+    assert local_tags() == ['unneeded-tag', 'v1.0']
+
+def test_update_filtered_import_fetch(repos_tmpdir):
+    # With update.import-fetch=filter, projects with imports should be
+    # resolved through a filtered fetch, then updated as usual.
+
+    remotes = repos_tmpdir / 'repos'
+    zephyr = remotes / 'zephyr'
+    for option in ['uploadpack.allowFilter', 'uploadpack.allowAnySHA1InWant']:
+        subprocess.check_call([GIT, 'config', option, 'true'],
+                              cwd=str(zephyr))
+
+    ws = repos_tmpdir / 'ws'
+    create_workspace(ws, and_git=True)
+    manifest_repo = ws / 'mp'
+    create_repo(manifest_repo)
+    add_commit(manifest_repo, 'manifest repo commit',
+               files={'west.yml':
+                      f'''
+                      manifest:
+                        projects:
+                        - name: zephyr
+                          url: {zephyr}
+                          import: true
+                      '''})
+    cmd(f'init -l {manifest_repo}')
+    cmd('config update.import-fetch filter', cwd=ws)
+
+    out = cmd('-vv update', cwd=ws)
+    assert 'zephyr: fetching manifest data' in out
+    assert 'filtered fetch failed' not in out
+    assert not (ws / '.west' / 'imports' / 'zephyr').check()
+
+    for path in ['zephyr', 'subdir/Kconfiglib', 'tagged_repo', 'net-tools']:
+        assert (ws / path).check(dir=1)
+    assert rev_parse(str(ws / 'zephyr'), 'HEAD') == \
+        rev_parse(str(zephyr), 'HEAD')
+    assert (ws / 'zephyr' / 'west.yml').check(file=1)
+    assert check_output([GIT, 'rev-parse', '--is-shallow-repository'],
+                        cwd=str(ws / 'zephyr')).strip() == 'false'
+
 def test_update_some_with_imports(repos_tmpdir):
     # 'west update project1 project2' should work fine even when
-    # imports are used, as long as the relevant projects are all
-    # defined in the manifest repository.
-    #
-    # It currently should fail with a helpful message if the projects
-    # are resolved via project imports.
+    # imports are used. Projects defined in the manifest repository
+    # shouldn't need anything else updated, and projects resolved via
+    # project imports should only need the projects they were
+    # imported from updated first.
 
     remotes = repos_tmpdir / 'repos'
     zephyr = remotes / 'zephyr'
@@ -365,17 +1042,6 @@ def test_update_some_with_imports(repos_tmpdir):
 
     cmd(f'init -l {manifest_repo}')
 
-    # Updating unknown projects should fail as always.
-
-    with pytest.raises(subprocess.CalledProcessError):
-        cmd('update unknown-project', cwd=ws)
-
-    # Updating a list of projects when some are resolved via project
-    # imports must fail.
-
-    with pytest.raises(subprocess.CalledProcessError):
-        cmd('update Kconfiglib net-tools', cwd=ws)
-
     # Updates of projects defined in the manifest repository or all
     # projects must succeed, and behave the same as if no imports
     # existed.
@@ -390,13 +1056,100 @@ def test_update_some_with_imports(repos_tmpdir):
     assert net_tools_project.is_cloned()
     assert not zephyr_project.is_cloned()
 
+    # Updating a project resolved via zephyr's import updates zephyr
+    # first, but nothing else.
+
+    cmd('update Kconfiglib', cwd=ws)
+    manifest = Manifest.from_file(topdir=ws)
+    kconfiglib, tagged_repo = manifest.get_projects(['Kconfiglib',
+                                                    'tagged_repo'])
+    assert zephyr_project.is_cloned()
+    assert kconfiglib.is_cloned()
+    assert not tagged_repo.is_cloned()
+    assert [p.name for p in manifest._import_chain(kconfiglib)] == ['zephyr']
+
     cmd('update zephyr', cwd=ws)
     assert zephyr_project.is_cloned()
 
+    # Updating unknown projects should fail as always.
+
+    with pytest.raises(subprocess.CalledProcessError):
+        cmd('update unknown-project', cwd=ws)
+
     cmd('update', cwd=ws)
     manifest = Manifest.from_file(topdir=ws)
     assert manifest.get_projects(['Kconfiglib'])[0].is_cloned()
 
+def test_update_some_with_nested_imports(repos_tmpdir):
+    # 'west update PROJECT' should update each project PROJECT was
+    # imported from using the revision its own provider has after
+    # that provider was updated, not before.
+    #
+    # Here, the manifest repository imports A, A imports B at tag v1,
+    # and B imports X at its tag v1. Then A moves B to v2, where B
+    # moves X to v2.
+
+    remotes = repos_tmpdir / 'repos'
+    a, b, x = remotes / 'A', remotes / 'B', remotes / 'X'
+    for repo in [a, b, x]:
+        create_repo(repo)
+
+    def b_at(rev):
+        return {'west.yml': f'''
+                manifest:
+                  projects:
+                  - name: B
+                    url: {b}
+                    revision: {rev}
+                    import: true
+                '''}
+
+    def x_at(rev):
+        return {'west.yml': f'''
+                manifest:
+                  projects:
+                  - name: X
+                    url: {x}
+                    revision: {rev}
+                '''}
+
+    add_commit(x, 'v1')
+    add_tag(x, 'v1')
+    add_commit(x, 'v2')
+    add_tag(x, 'v2')
+    add_commit(b, 'v1', files=x_at('v1'))
+    add_tag(b, 'v1')
+    add_commit(b, 'v2', files=x_at('v2'))
+    add_tag(b, 'v2')
+    create_branch(a, 'west', checkout=True)
+    add_commit(a, 'import B at v1', files=b_at('v1'))
+
+    ws = repos_tmpdir / 'ws'
+    create_workspace(ws, and_git=True)
+    manifest_repo = ws / 'mp'
+    create_repo(manifest_repo)
+    add_commit(manifest_repo, 'manifest repo commit',
+               files={'west.yml':
+                      f'''
+                      manifest:
+                        projects:
+                        - name: A
+                          url: {a}
+                          revision: west
+                          import: true
+                      '''})
+
+    cmd(f'init -l {manifest_repo}')
+    cmd('update', cwd=ws)
+    assert rev_parse(ws / 'B', 'HEAD') == rev_parse(b, 'v1^{commit}')
+    assert rev_parse(ws / 'X', 'HEAD') == rev_parse(x, 'v1^{commit}')
+
+    add_commit(a, 'import B at v2', files=b_at('v2'))
+    cmd('update X', cwd=ws)
+    assert rev_parse(ws / 'A', 'HEAD') == rev_parse(a, 'west')
+    assert rev_parse(ws / 'B', 'HEAD') == rev_parse(b, 'v2^{commit}')
+    assert rev_parse(ws / 'X', 'HEAD') == rev_parse(x, 'v2^{commit}')
+
 def test_init_again(west_init_tmpdir):
     # Test that 'west init' on an initialized tmpdir errors out
     # with a message that indicates it's already initialized.
@@ -825,6 +1578,72 @@ def test_change_remote_conflict(west_update_tmpdir):
 
     cmd('update')
 
+def test_update_sha_fetch(west_update_tmpdir):
+    # Test that 'west update' fetches SHAs directly when the remote
+    # allows it, remembers that in .west, and falls back on fetching
+    # all branches when we know the host doesn't allow it.
+    wct = west_update_tmpdir
+    remotes = wct / '..' / 'repos'
+    kconfiglib_remote = str(remotes / 'Kconfiglib')
+    cache = wct / '.west' / 'sha-fetch.json'
+
+    # Create a commit on a new remote branch which we don't need, then
+    # pin Kconfiglib to a commit on its 'zephyr' branch.
+    create_branch(kconfiglib_remote, 'unneeded')
+    checkout_branch(kconfiglib_remote, 'unneeded')
+    add_commit(kconfiglib_remote, 'unneeded commit')
+    unneeded = rev_parse(kconfiglib_remote, 'HEAD').strip()
+    checkout_branch(kconfiglib_remote, 'zephyr')
+    add_commit(kconfiglib_remote, 'needed commit')
+    needed = rev_parse(kconfiglib_remote, 'HEAD').strip()
+
+    def set_kconfiglib_revision(revision):
+        manifest = Manifest.from_file(topdir=wct)
+        manifest.get_projects(['Kconfiglib'])[0].revision = revision
+        with open(wct / 'zephyr' / 'west.yml', 'w') as f:
+            f.write(manifest.as_yaml())
+
+    set_kconfiglib_revision(needed)
+    cmd('update Kconfiglib')
+    kconfiglib = str(wct / 'subdir' / 'Kconfiglib')
+    assert rev_parse(kconfiglib, 'HEAD').strip() == needed
+    assert json.loads(cache.read()) == {'local': True}
+    cp = subprocess.run([GIT, 'cat-file', '-e', unneeded], cwd=kconfiglib)
+    assert cp.returncode != 0, 'fetched a commit on an unneeded branch'
+
+    # If the host is known not to support it, we fall back on
+    # fetching all branches.
+    cache.write(json.dumps({'local': False}))
+    add_commit(kconfiglib_remote, 'another needed commit')
+    needed = rev_parse(kconfiglib_remote, 'HEAD').strip()
+    set_kconfiglib_revision(needed)
+    cmd('update Kconfiglib')
+    assert rev_parse(kconfiglib, 'HEAD').strip() == needed
+    assert json.loads(cache.read()) == {'local': False}
+    subprocess.check_call([GIT, 'cat-file', '-e', unneeded], cwd=kconfiglib)
+
+    # A SHA which doesn't exist at all says nothing about the host,
+    # so it isn't remembered.
+    cache.remove()
+    set_kconfiglib_revision('a' * 40)
+    with pytest.raises(subprocess.CalledProcessError):
+        cmd('update Kconfiglib', stderr=subprocess.DEVNULL)
+    assert not cache.exists()
+
+    # The host is only remembered as not supporting it when it refuses
+    # to send the SHA, not when fetching fails for other reasons.
+    # Protocol version 0 refuses SHAs which aren't branch tips, unless
+    # uploadpack.allowReachableSHA1InWant is set.
+    add_commit(kconfiglib_remote, 'needed, but not a tip')
+    needed = rev_parse(kconfiglib_remote, 'HEAD').strip()
+    add_commit(kconfiglib_remote, 'tip')
+    set_kconfiglib_revision(needed)
+    cmd('update Kconfiglib',
+        env=dict(os.environ, GIT_CONFIG_COUNT='1',
+                 GIT_CONFIG_KEY_0='protocol.version', GIT_CONFIG_VALUE_0='0'))
+    assert rev_parse(kconfiglib, 'HEAD').strip() == needed
+    assert json.loads(cache.read()) == {'local': False}
+
 def test_import_project_release(repos_tmpdir):
     # Tests for a workspace that's based off of importing from a
     # project at a fixed release, with no downstream project forks.